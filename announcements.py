@@ -0,0 +1,55 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+
+
+class BurstCoalescer:
+    # Announces events one by one while they arrive slowly. Once more than
+    # `threshold` events of a kind land within `window` seconds, further events
+    # are buffered and posted as a single digest at the end of each window, so
+    # at most threshold + 1 messages per kind go out per window.
+
+    def __init__(self, send_single, send_digest, threshold=5, window=10.0):
+        self.send_single = send_single
+        self.send_digest = send_digest
+        self.threshold = threshold
+        self.window = window
+        self._recent = defaultdict(deque)
+        self._buffers = defaultdict(list)
+        self._flush_tasks = {}
+
+    async def announce(self, kind, item):
+        now = time.monotonic()
+        recent = self._recent[kind]
+        recent.append(now)
+        while recent and recent[0] <= now - self.window:
+            recent.popleft()
+
+        if self._buffers[kind] or len(recent) > self.threshold:
+            self._buffers[kind].append(item)
+            if kind not in self._flush_tasks:
+                self._flush_tasks[kind] = asyncio.create_task(self._flush_later(kind))
+            return
+        await self.send_single(kind, item)
+
+    async def _flush_later(self, kind):
+        try:
+            await asyncio.sleep(self.window)
+            await self.flush(kind)
+        finally:
+            self._flush_tasks.pop(kind, None)
+
+    async def flush(self, kind):
+        items, self._buffers[kind] = self._buffers[kind], []
+        if items:
+            await self.send_digest(kind, items)
+
+    async def close(self):
+        for task in list(self._flush_tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._flush_tasks.values(), return_exceptions=True)
+        for kind in list(self._buffers):
+            try:
+                await self.flush(kind)
+            except Exception as e:
+                print(f"Flushing {kind} digest failed: {e}")
@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+SEGMENT_SUFFIX = '.jsonl.gz'
+KINDS = ('keys', 'users')
+
+
+class Archive:
+    # Cold storage for redeemed keys and terminated slots: one gzipped JSONL
+    # segment per kind and month, e.g. keys-2024-05.jsonl.gz. Each archival
+    # pass appends a new gzip member, which gzip readers treat as one stream,
+    # so segments are never rewritten.
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, kind, month):
+        return os.path.join(self.directory, f"{kind}-{month}{SEGMENT_SUFFIX}")
+
+    def segments(self, kind=None):
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+        if kind is not None:
+            names = [name for name in names if name.startswith(kind + "-")]
+        return [os.path.join(self.directory, name) for name in names]
+
+    def append(self, kind, records, month_field):
+        # records: {id: record}; each lands in the segment for the month in
+        # record[month_field] (an ISO timestamp).
+        by_month = {}
+        for ident, record in records.items():
+            by_month.setdefault(record[month_field][:7], []).append((ident, record))
+        os.makedirs(self.directory, exist_ok=True)
+        archived_at = datetime.utcnow().isoformat()
+        for month, entries in by_month.items():
+            with open(self._path(kind, month), 'ab') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='ab') as f:
+                    for ident, record in entries:
+                        line = json.dumps({"id": ident, "archived_at": archived_at, "record": record})
+                        f.write(line.encode() + b"\n")
+                raw.flush()
+                os.fsync(raw.fileno())
+
+    def lookup(self, query, kind=None):
+        # Streams every segment, yielding (kind, id, record) for entries whose
+        # ID or any field value equals query. Lines that can't contain the
+        # query are skipped before parsing.
+        needle = json.dumps(query).encode()
+        for path in self.segments(kind):
+            entry_kind = os.path.basename(path).split("-", 1)[0]
+            with gzip.open(path, 'rb') as f:
+                for line in f:
+                    if needle not in line:
+                        continue
+                    entry = json.loads(line)
+                    if entry["id"] == query or query in entry["record"].values():
+                        yield entry_kind, entry["id"], entry["record"]
+
+
+async def archive_cold(store, archive, older_than_days):
+    # Records are written to the archive first and only then removed from the
+    # store, and only if they are unchanged, so a crash in between leaves a
+    # duplicate in the archive rather than losing anything.
+    cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).isoformat()
+    keys, users = await store.cold_records(cutoff)
+    if keys:
+        await asyncio.to_thread(archive.append, 'keys', keys, 'redeemed_at')
+        await store.remove_keys(keys)
+    if users:
+        await asyncio.to_thread(archive.append, 'users', users, 'terminated_at')
+        await store.remove_users(users)
+    return len(keys), len(users)
+
+
+class Archiver:
+    def __init__(self, store, archive, older_than_days, interval):
+        self.store = store
+        self.archive = archive
+        self.older_than_days = older_than_days
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                keys, users = await archive_cold(self.store, self.archive, self.older_than_days)
+                if keys or users:
+                    print(f"Archived {keys} redeemed keys and {users} terminated slots")
+            except Exception as e:
+                # Logged and retried next interval; one bad pass must not stop archiving.
+                print(f"Archival pass failed: {e!r}")
+            await asyncio.sleep(self.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the Shampoo MP archive")
+    parser.add_argument('query', help="A key, user ID or any other field value")
+    parser.add_argument('--kind', choices=KINDS)
+    parser.add_argument('--dir', default='database/archive')
+    args = parser.parse_args()
+
+    found = 0
+    for kind, ident, record in Archive(args.dir).lookup(args.query, args.kind):
+        print(json.dumps({"kind": kind, "id": ident, "record": record}, indent=4))
+        found += 1
+    print(f"{found} archived record(s) match {args.query}")
+
+if __name__ == '__main__':
+    main()
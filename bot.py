@@ -2,19 +2,48 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 import configparser
-import random
-import string
 import json
+import io
+import itertools
+import math
 import os
 import asyncio
+import time
 from datetime import datetime, timedelta
+from store import JsonStore
+from sqlite_store import SqliteStore
+from scheduler import DeletionQueue, Scheduler, iso_to_epoch
+from slot_pool import SlotPool
+from locks import StripedLocks
+from archive import Archive, Archiver
+from reconcile import find_drift
+from command_sync import sync_if_changed
+from members import MemberLRU
+from stats import STATS_SNAPSHOT_FILE, SnapshotWriter
+import metrics
+from interactions import deferred
+from dm_queue import DMQueue
+from announcements import BurstCoalescer
+from keygen import MAX_KEYS_PER_BATCH, mint_keys, render_keys_file
+from ratelimit import KeyFilter, TokenBucketLimiter
+from permissions import (
+    EXPIRED_OWNER, HIDDEN_EVERYONE, TERMINATED_OWNER,
+    member_target, merged_overwrites, slot_overwrites
+)
 
 os.makedirs('database', exist_ok=True)
 
 CONFIG_FILE = 'config.ini'
 VALID_KEYS_FILE = 'database/valid_keys.json'
+RETIRED_KEYS_FILE = 'database/retired_keys.json'
 USER_DB_FILE = 'database/user_database.json'
 ADMINS_FILE = 'database/admins.json'
+SQLITE_DB_FILE = 'database/shampoo.db'
+JOURNAL_DIR = 'database/journal'
+ARCHIVE_DIR = 'database/archive'
+PENDING_DELETIONS_FILE = 'database/pending_deletions.json'
+DM_DEAD_LETTER_FILE = 'database/dm_dead_letters.jsonl'
+COMMAND_HASH_FILE = 'database/command_tree.sha256'
 
 if not os.path.exists(CONFIG_FILE):
     default_config = configparser.ConfigParser()
@@ -27,6 +56,36 @@ if not os.path.exists(CONFIG_FILE):
     default_config['Embeds'] = {
         'Thumbnail_Url': 'YOUR_THUMBNAIL_URL_HERE'
     }
+    default_config['Announcements'] = {
+        'Burst_Threshold': '5',
+        'Burst_Window': '10'
+    }
+    default_config['RateLimits'] = {
+        'Redeem_User_Per_Minute': '6',
+        'Redeem_User_Burst': '3',
+        'Redeem_Guild_Per_Minute': '120',
+        'Redeem_Guild_Burst': '30'
+    }
+    default_config['Slots'] = {
+        'Warm_Pool_Size': '3'
+    }
+    default_config['Archive'] = {
+        'Key_Age_Days': '30',
+        'Interval_Hours': '24'
+    }
+    default_config['Cache'] = {
+        'Low_Memory_Mode': 'false',
+        'Member_LRU_Size': '256'
+    }
+    default_config['Web'] = {
+        'Stats_Snapshot_Interval': '30',
+        'Metrics_Interval': '15'
+    }
+    default_config['Storage'] = {
+        'Backend': 'json',
+        'Flush_Interval': '5',
+        'Compact_Journal_Bytes': '4194304'
+    }
     with open(CONFIG_FILE, 'w') as f:
         default_config.write(f)
     print("config.ini created. Fill in Token, slot_id, Main_Admin_Id, and Thumbnail_Url then restart.")
@@ -45,37 +104,102 @@ SLOT_CATEGORY_ID = int(config['Settings']['slot_id'])
 MAIN_ADMIN_ID = int(config['Settings']['Main_Admin_Id'])
 GATEWAY_CHANNEL_ID = int(config['Settings']['Gateway_Channel_Id'])
 THUMBNAIL_URL = config['Embeds']['Thumbnail_Url']
+BURST_THRESHOLD = config.getint('Announcements', 'Burst_Threshold', fallback=5)
+BURST_WINDOW = config.getfloat('Announcements', 'Burst_Window', fallback=10.0)
+REDEEM_USER_PER_MINUTE = config.getfloat('RateLimits', 'Redeem_User_Per_Minute', fallback=6)
+REDEEM_USER_BURST = config.getint('RateLimits', 'Redeem_User_Burst', fallback=3)
+REDEEM_GUILD_PER_MINUTE = config.getfloat('RateLimits', 'Redeem_Guild_Per_Minute', fallback=120)
+REDEEM_GUILD_BURST = config.getint('RateLimits', 'Redeem_Guild_Burst', fallback=30)
+SLOT_POOL_SIZE = config.getint('Slots', 'Warm_Pool_Size', fallback=0)
+ARCHIVE_KEY_AGE_DAYS = config.getfloat('Archive', 'Key_Age_Days', fallback=30)
+ARCHIVE_INTERVAL_HOURS = config.getfloat('Archive', 'Interval_Hours', fallback=24)
+LOW_MEMORY_MODE = config.getboolean('Cache', 'Low_Memory_Mode', fallback=False)
+MEMBER_LRU_SIZE = config.getint('Cache', 'Member_LRU_Size', fallback=256)
+STATS_SNAPSHOT_INTERVAL = config.getfloat('Web', 'Stats_Snapshot_Interval', fallback=30)
+METRICS_INTERVAL = config.getfloat('Web', 'Metrics_Interval', fallback=15)
+STORAGE_BACKEND = config.get('Storage', 'Backend', fallback='json').lower()
+FLUSH_INTERVAL = config.getfloat('Storage', 'Flush_Interval', fallback=5.0)
+COMPACT_JOURNAL_BYTES = config.getint('Storage', 'Compact_Journal_Bytes', fallback=4 * 1024 * 1024)
 FOOTER_TEXT = "Shampoo MP"
+CATEGORY_CHANNEL_LIMIT = 50
+EXPIRY_RETRY_SECONDS = 300
+INLINE_KEY_LIMIT = 50
 
 KEY_TYPE_LICENSE = "license"
 KEY_TYPE_LICENSE_LIFETIME = "license_lifetime"
 KEY_TYPE_EVERYONE = "everyone_ping"
 KEY_TYPE_HERE = "here_ping"
 
-intents = discord.Intents.default()
-intents.members = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+if STORAGE_BACKEND == 'sqlite':
+    store = SqliteStore(SQLITE_DB_FILE)
+else:
+    store = JsonStore(
+        VALID_KEYS_FILE, USER_DB_FILE, ADMINS_FILE,
+        flush_interval=FLUSH_INTERVAL, journal_dir=JOURNAL_DIR, compact_bytes=COMPACT_JOURNAL_BYTES,
+        retired_path=RETIRED_KEYS_FILE
+    )
 
-def load_json(path):
-    with open(path, 'r') as f:
-        return json.load(f)
+class ShampooBot(commands.Bot):
+    async def setup_hook(self):
+        await store.load()
+        store.start()
+        await key_filter.rebuild(store)
+        expiry_scheduler.load((uid, iso_to_epoch(expiry)) for uid, expiry in await store.expiring_slots())
+        await deletion_queue.load()
+        dm_queue.start()
+        archiver.start()
+
+    _shutdown_task = None
+
+    async def close(self):
+        # Callable more than once (signal handler and runner); shuts down once.
+        if self._shutdown_task is None:
+            self._shutdown_task = asyncio.create_task(self._shutdown())
+        await self._shutdown_task
+
+    async def _shutdown(self):
+        await announcer.close()
+        await super().close()
+        await dm_queue.close()
+        await expiry_scheduler.close()
+        await deletion_queue.close()
+        await slot_pool.close()
+        await archiver.close()
+        await stats_writer.close()
+        await metrics_writer.close()
+        await store.close()
+
+archive = Archive(ARCHIVE_DIR)
+archiver = Archiver(store, archive, ARCHIVE_KEY_AGE_DAYS, ARCHIVE_INTERVAL_HOURS * 3600)
+
+redeem_user_limiter = TokenBucketLimiter(REDEEM_USER_PER_MINUTE / 60, REDEEM_USER_BURST)
+redeem_guild_limiter = TokenBucketLimiter(REDEEM_GUILD_PER_MINUTE / 60, REDEEM_GUILD_BURST)
+key_filter = KeyFilter()
+user_locks = StripedLocks()
+key_locks = StripedLocks()
+
+slot_pool = SlotPool(SLOT_POOL_SIZE, lambda channel_id: store.channel_owner(channel_id) is not None)
 
-def save_json(path, data):
-    with open(path, 'w') as f:
-        json.dump(data, f, indent=4)
+intents = discord.Intents.default()
+intents.members = True
+if LOW_MEMORY_MODE:
+    # The member list is neither chunked at startup nor cached; slot owners are
+    # fetched on demand through member_lru. Joins still arrive as on_member_join,
+    # departures only as on_raw_member_remove.
+    bot = ShampooBot(
+        command_prefix='!', intents=intents, tree_cls=metrics.InstrumentedTree, http_trace=metrics.http_trace(),
+        chunk_guilds_at_startup=False, member_cache_flags=discord.MemberCacheFlags.none()
+    )
+else:
+    bot = ShampooBot(command_prefix='!', intents=intents, tree_cls=metrics.InstrumentedTree, http_trace=metrics.http_trace())
+member_lru = MemberLRU(MEMBER_LRU_SIZE)
+dm_queue = DMQueue(bot, DM_DEAD_LETTER_FILE)
+metrics.dm_queue_depth.set_function(lambda: len(dm_queue))
 
 def is_admin(user_id: int):
     if user_id == MAIN_ADMIN_ID:
         return True
-    admins = load_json(ADMINS_FILE)
-    return str(user_id) in admins
-
-def generate_key():
-    letters = random.choices(string.ascii_uppercase, k=4)
-    numbers = random.choices(string.digits, k=4)
-    combined = letters + numbers
-    random.shuffle(combined)
-    return f"Shampoo-MP-{''.join(combined)}"
+    return store.is_admin(str(user_id))
 
 def time_remaining(expiry_iso):
     delta = datetime.fromisoformat(expiry_iso) - datetime.utcnow()
@@ -86,13 +210,6 @@ def time_remaining(expiry_iso):
     minutes = remainder // 60
     return f"{days}d {hours}h {minutes}m"
 
-def find_user_by_channel(channel_id: str):
-    user_db = load_json(USER_DB_FILE)
-    for uid, data in user_db.items():
-        if data.get("slot_channel_id") == channel_id:
-            return uid, data
-    return None, None
-
 def build_embed(title, description, color):
     embed = discord.Embed(title=title, description=description, color=color)
     embed.set_thumbnail(url=THUMBNAIL_URL)
@@ -107,34 +224,6 @@ def guild_only():
         return True
     return app_commands.check(predicate)
 
-async def apply_slot_permissions(channel: discord.TextChannel, owner: discord.Member, guild: discord.Guild):
-    await channel.set_permissions(guild.default_role, overwrite=discord.PermissionOverwrite(
-        read_messages=True,
-        send_messages=False,
-        send_messages_in_threads=False,
-        create_public_threads=False,
-        create_private_threads=False,
-        add_reactions=False,
-        mention_everyone=False
-    ))
-    await channel.set_permissions(owner, overwrite=discord.PermissionOverwrite(
-        read_messages=True,
-        send_messages=True,
-        embed_links=True,
-        attach_files=True,
-        add_reactions=True,
-        manage_channels=True,
-        create_public_threads=False,
-        create_private_threads=False,
-        mention_everyone=False
-    ))
-    await channel.set_permissions(guild.me, overwrite=discord.PermissionOverwrite(
-        read_messages=True,
-        send_messages=True,
-        manage_channels=True,
-        manage_permissions=True
-    ))
-
 async def send_slot_created_embed(channel: discord.TextChannel, owner: discord.Member, created_at: str, expiry_iso: str, duration_label: str):
     is_lifetime = expiry_iso is None
     if is_lifetime:
@@ -168,18 +257,131 @@ async def send_slot_created_embed(channel: discord.TextChannel, owner: discord.M
     embed.set_footer(text=FOOTER_TEXT)
     await channel.send(embed=embed)
 
+async def expire_slot(user_id: str):
+    data = await store.get_user(user_id)
+    if data is None or not data.get("active") or not data.get("expiry"):
+        return
+
+    due = iso_to_epoch(data["expiry"])
+    if due > time.time():
+        expiry_scheduler.schedule(user_id, due)
+        return
+
+    # The channel is locked before the slot is marked expired, so a failed edit
+    # leaves the slot active and the expiry is simply retried.
+    async with user_locks.hold(user_id):
+        current = await store.get_user(user_id)
+        if current is None or not current.get("active") or current.get("expiry") != data["expiry"]:
+            return
+        channel = bot.get_channel(int(current["slot_channel_id"])) if current.get("slot_channel_id") else None
+        if channel is not None:
+            owner = member_target(channel.guild, int(user_id))
+            try:
+                await channel.edit(overwrites=merged_overwrites(channel, {owner: EXPIRED_OWNER}))
+            except discord.HTTPException as e:
+                print(f"Locking expired slot of user {user_id} failed, retrying in {EXPIRY_RETRY_SECONDS}s: {e}")
+                expiry_scheduler.schedule(user_id, time.time() + EXPIRY_RETRY_SECONDS)
+                return
+        expired = await store.update_user_if(
+            user_id, {"active": True, "expiry": data["expiry"]},
+            active=False, expired=True, expired_at=datetime.utcnow().isoformat()
+        )
+    if expired is None or channel is None:
+        return
+
+    embed = build_embed(
+        title="⌛ Slot Expired",
+        description=(
+            f"This slot's subscription has ended and the channel has been locked.\n\n"
+            f"**Slot Owner:** <@{user_id}>\n"
+            f"**Expired At:** <t:{int(due)}:F>\n\n"
+            f"Redeem a new license key or contact staff to renew."
+        ),
+        color=0x2b2b2b
+    )
+    await channel.send(embed=embed)
+
+expiry_scheduler = Scheduler(expire_slot)
+
+async def delete_slot_channel(channel_id: str, job: dict):
+    channel = bot.get_channel(int(channel_id))
+    if channel is None:
+        return
+    try:
+        await channel.delete(reason=job["reason"])
+    except discord.NotFound:
+        pass
+
+deletion_queue = DeletionQueue(PENDING_DELETIONS_FILE, delete_slot_channel)
+
+async def mark_orphaned(user_id: str, channel_id: str):
+    async with user_locks.hold(user_id):
+        orphaned = await store.update_user_if(
+            user_id, {"active": True, "slot_channel_id": channel_id},
+            active=False, orphaned=True, orphaned_at=datetime.utcnow().isoformat()
+        )
+    if orphaned is None:
+        return False
+    expiry_scheduler.cancel(user_id)
+    return True
+
+async def reconcile_slots(guild: discord.Guild):
+    orphans, unowned = await find_drift(
+        store, guild, SLOT_CATEGORY_ID,
+        lambda channel: slot_pool.is_pool_channel(channel) or str(channel.id) in deletion_queue.jobs
+    )
+    marked = {channel_id: user_id for channel_id, user_id in orphans.items() if await mark_orphaned(user_id, channel_id)}
+    print(f"[Reconcile] {len(marked)} orphaned slot(s) marked inactive, {len(unowned)} unowned channel(s) in the slot category")
+    return marked, unowned
+
+async def build_stats_snapshot():
+    counts = await store.slot_counts()
+    category = bot.get_channel(SLOT_CATEGORY_ID)
+    if isinstance(category, discord.CategoryChannel):
+        # Unclaimed pool channels already count against the category limit but
+        # can still be handed out.
+        available = max(0, CATEGORY_CHANNEL_LIMIT - len(category.channels) + len(slot_pool))
+        member_count = category.guild.member_count
+    else:
+        available, member_count = 0, None
+    return {
+        "active_slots": counts["active"],
+        "lifetime_slots": counts["lifetime"],
+        "timed_slots": counts["timed"],
+        "available_slots": available,
+        "member_count": member_count,
+        "generated_at": datetime.utcnow().isoformat()
+    }
+
+stats_writer = SnapshotWriter(STATS_SNAPSHOT_FILE, build_stats_snapshot, STATS_SNAPSHOT_INTERVAL)
+
+async def render_metrics():
+    metrics.generated_at.set(time.time())
+    return metrics.render()
+
+metrics_writer = SnapshotWriter(metrics.METRICS_FILE, render_metrics, METRICS_INTERVAL, write=metrics.write_exposition)
+
 @bot.event
 async def on_ready():
-    await bot.tree.sync()
+    expiry_scheduler.start()
+    deletion_queue.start()
+    stats_writer.start()
+    metrics_writer.start()
+    category = bot.get_channel(SLOT_CATEGORY_ID)
+    if isinstance(category, discord.CategoryChannel):
+        slot_pool.start(category)
+    synced = await sync_if_changed(bot.tree, COMMAND_HASH_FILE, bot.application_id)
+    print("Command tree unchanged, skipped sync" if synced is None else f"Synced {len(synced)} command(s)")
     await bot.change_presence(activity=discord.CustomActivity(name="Shampoo MP"))
     print(f"Logged in as {bot.user}")
+    if isinstance(category, discord.CategoryChannel):
+        try:
+            await reconcile_slots(category.guild)
+        except discord.HTTPException as e:
+            print(f"Slot reconciliation failed: {e}")
 
 
-@bot.event
-async def on_member_join(member: discord.Member):
-    channel = member.guild.get_channel(GATEWAY_CHANNEL_ID)
-    if channel is None:
-        return
+def member_join_embed(member: discord.Member):
     member_count = member.guild.member_count
     joined_ts = int(member.joined_at.timestamp()) if member.joined_at else int(__import__('datetime').datetime.utcnow().timestamp())
     embed = discord.Embed(
@@ -198,14 +400,10 @@ async def on_member_join(member: discord.Member):
     embed.add_field(name="👥 Member Count", value=f"**{member_count}** members", inline=False)
     embed.set_thumbnail(url=THUMBNAIL_URL)
     embed.set_footer(text=FOOTER_TEXT)
-    await channel.send(embed=embed)
+    return embed
 
-@bot.event
-async def on_member_remove(member: discord.Member):
-    channel = member.guild.get_channel(GATEWAY_CHANNEL_ID)
-    if channel is None:
-        return
-    member_count = member.guild.member_count
+def member_remove_embed(member: discord.abc.User, guild: discord.Guild):
+    member_count = guild.member_count
     embed = discord.Embed(
         title="👋 Member Left",
         description=(
@@ -218,51 +416,107 @@ async def on_member_remove(member: discord.Member):
     embed.add_field(name="👥 Remaining Members", value=f"**{member_count}** members", inline=False)
     embed.set_thumbnail(url=THUMBNAIL_URL)
     embed.set_footer(text=FOOTER_TEXT)
+    return embed
+
+def member_digest_embed(kind: str, members: list, guild: discord.Guild):
+    joined = kind == "join"
+    count = len(members)
+    shown = ", ".join(m.mention if joined else f"**{m.name}**" for m in members[:20])
+    if count > 20:
+        shown += f" and {count - 20} more"
+    embed = discord.Embed(
+        title=f"🎉 {count} members joined Shampoo MP!" if joined else f"👋 {count} members left Shampoo MP",
+        description=shown,
+        color=0xFF4444 if joined else 0x2b2b2b
+    )
+    embed.add_field(
+        name="👥 Member Count" if joined else "👥 Remaining Members",
+        value=f"**{guild.member_count}** members",
+        inline=False
+    )
+    embed.set_thumbnail(url=THUMBNAIL_URL)
+    embed.set_footer(text=FOOTER_TEXT)
+    return embed
+
+# Departed members may arrive as plain users (see on_raw_member_remove), so the
+# guild is taken from the gateway channel rather than from the member.
+async def send_member_announcement(kind: str, member: discord.abc.User):
+    channel = bot.get_channel(GATEWAY_CHANNEL_ID)
+    if channel is None:
+        return
+    embed = member_join_embed(member) if kind == "join" else member_remove_embed(member, channel.guild)
     await channel.send(embed=embed)
 
+async def send_member_digest(kind: str, members: list):
+    channel = bot.get_channel(GATEWAY_CHANNEL_ID)
+    if channel is None:
+        return
+    await channel.send(embed=member_digest_embed(kind, members, channel.guild))
+
+announcer = BurstCoalescer(send_member_announcement, send_member_digest, threshold=BURST_THRESHOLD, window=BURST_WINDOW)
+
+@bot.event
+async def on_member_join(member: discord.Member):
+    metrics.gateway_member_events.inc(event="join")
+    await announcer.announce("join", member)
+
+@bot.event
+async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent):
+    # on_member_remove only fires for cached members, so it never fires in
+    # low-memory mode; payload.user is the Member when it was cached.
+    metrics.gateway_member_events.inc(event="remove")
+    member_lru.discard(payload.guild_id, payload.user.id)
+    await announcer.announce("remove", payload.user)
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    user_id = store.channel_owner(str(channel.id))
+    if user_id is not None and await mark_orphaned(user_id, str(channel.id)):
+        print(f"[Reconcile] Slot channel {channel.name} of user {user_id} was deleted; slot marked inactive")
+
 @bot.tree.command(name="generatekeys", description="Generate keys for slots, @here pings, or @everyone pings")
 @app_commands.describe(
     type="Type of key to generate",
     amount="Number of keys to generate",
-    duration="Duration in days (only for timed License keys)"
+    duration="Duration in days (only for timed License keys)",
+    file_format="File format used when the keys are too many to list in a message"
 )
 @app_commands.choices(type=[
     app_commands.Choice(name="License", value=KEY_TYPE_LICENSE),
     app_commands.Choice(name="License (Lifetime)", value=KEY_TYPE_LICENSE_LIFETIME),
     app_commands.Choice(name="@here Ping", value=KEY_TYPE_HERE),
     app_commands.Choice(name="@everyone Ping", value=KEY_TYPE_EVERYONE),
+], file_format=[
+    app_commands.Choice(name="Text (.txt)", value="txt"),
+    app_commands.Choice(name="CSV (.csv)", value="csv"),
 ])
 @guild_only()
-async def generatekeys(interaction: discord.Interaction, type: str, amount: int, duration: int = None):
+@deferred()
+async def generatekeys(interaction: discord.Interaction, type: str, amount: app_commands.Range[int, 1, MAX_KEYS_PER_BATCH], duration: int = None, file_format: str = "txt"):
     if not is_admin(interaction.user.id):
-        await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
+        await interaction.followup.send("❌ You don't have permission to use this command.", ephemeral=True)
         return
 
     if type == KEY_TYPE_LICENSE and duration is None:
-        await interaction.response.send_message("❌ Duration (in days) is required for timed License keys.", ephemeral=True)
+        await interaction.followup.send("❌ Duration (in days) is required for timed License keys.", ephemeral=True)
         return
 
-    valid_keys = load_json(VALID_KEYS_FILE)
-    new_keys = []
-    expiry = (datetime.utcnow() + timedelta(days=duration)).isoformat() if (type == KEY_TYPE_LICENSE and duration) else None
-
-    for _ in range(amount):
-        key = generate_key()
-        while key in valid_keys:
-            key = generate_key()
-        valid_keys[key] = {
-            "type": type,
-            "duration_days": duration if type == KEY_TYPE_LICENSE else ("Lifetime" if type == KEY_TYPE_LICENSE_LIFETIME else None),
-            "expiry": expiry,
-            "generated_at": datetime.utcnow().isoformat(),
-            "generated_by": str(interaction.user.id),
-            "redeemed": False,
-            "redeemed_by": None,
-            "redeemed_at": None
-        }
-        new_keys.append(key)
+    generated_at = datetime.utcnow()
+    expiry = (generated_at + timedelta(days=duration)).isoformat() if (type == KEY_TYPE_LICENSE and duration) else None
 
-    save_json(VALID_KEYS_FILE, valid_keys)
+    keys = await mint_keys(store, amount)
+    template = {
+        "type": type,
+        "duration_days": duration if type == KEY_TYPE_LICENSE else ("Lifetime" if type == KEY_TYPE_LICENSE_LIFETIME else None),
+        "expiry": expiry,
+        "generated_at": generated_at.isoformat(),
+        "generated_by": str(interaction.user.id),
+        "redeemed": False,
+        "redeemed_by": None,
+        "redeemed_at": None
+    }
+    async with key_filter.adding(keys, store):
+        await store.add_key_batch(keys, template)
 
     type_label = {
         KEY_TYPE_LICENSE: "License",
@@ -271,12 +525,16 @@ async def generatekeys(interaction: discord.Interaction, type: str, amount: int,
         KEY_TYPE_HERE: "@here Ping"
     }[type]
     duration_text = f" — {duration} day(s) each" if (type == KEY_TYPE_LICENSE and duration) else (" — Lifetime" if type == KEY_TYPE_LICENSE_LIFETIME else "")
-    keys_display = "\n".join(f"`{k}`" for k in new_keys)
+    header = f"**Generated {amount} {type_label} key(s){duration_text}:**"
 
-    await interaction.response.send_message(
-        f"**Generated {amount} {type_label} key(s){duration_text}:**\n\n{keys_display}",
-        ephemeral=True
-    )
+    if amount <= INLINE_KEY_LIMIT:
+        keys_display = "\n".join(f"`{k}`" for k in keys)
+        await interaction.followup.send(f"{header}\n\n{keys_display}", ephemeral=True)
+        return
+
+    data = await asyncio.to_thread(render_keys_file, keys, template, file_format)
+    filename = f"{type}-keys-{generated_at.strftime('%Y%m%d-%H%M%S')}.{file_format}"
+    await interaction.followup.send(header, file=discord.File(io.BytesIO(data), filename=filename), ephemeral=True)
 
 @bot.tree.command(name="sendkey", description="Generate and DM a key directly to a user")
 @app_commands.describe(user="The user to send the key to", duration="Duration of the key in days")
@@ -286,25 +544,21 @@ async def sendkey(interaction: discord.Interaction, user: discord.Member, durati
         await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
         return
 
-    valid_keys = load_json(VALID_KEYS_FILE)
     expiry = (datetime.utcnow() + timedelta(days=duration)).isoformat()
 
-    key = generate_key()
-    while key in valid_keys:
-        key = generate_key()
-
-    valid_keys[key] = {
-        "type": KEY_TYPE_LICENSE,
-        "duration_days": duration,
-        "expiry": expiry,
-        "generated_at": datetime.utcnow().isoformat(),
-        "generated_by": str(interaction.user.id),
-        "sent_to": str(user.id),
-        "redeemed": False,
-        "redeemed_by": None,
-        "redeemed_at": None
-    }
-    save_json(VALID_KEYS_FILE, valid_keys)
+    key, = await mint_keys(store, 1)
+    async with key_filter.adding([key], store):
+        await store.add_keys({key: {
+            "type": KEY_TYPE_LICENSE,
+            "duration_days": duration,
+            "expiry": expiry,
+            "generated_at": datetime.utcnow().isoformat(),
+            "generated_by": str(interaction.user.id),
+            "sent_to": str(user.id),
+            "redeemed": False,
+            "redeemed_by": None,
+            "redeemed_at": None
+        }})
 
     embed = discord.Embed(
         title="✨ **Shampoo MP** Subscription Key Delivery",
@@ -323,51 +577,61 @@ async def sendkey(interaction: discord.Interaction, user: discord.Member, durati
     embed.set_thumbnail(url=THUMBNAIL_URL)
     embed.set_footer(text=FOOTER_TEXT)
 
-    try:
-        await user.send(embed=embed)
-        await interaction.response.send_message(f"✅ Key sent to {user.mention} via DM.", ephemeral=True)
-    except discord.Forbidden:
-        await interaction.response.send_message(f"❌ Could not DM {user.mention}. They may have DMs disabled.", ephemeral=True)
+    async def notify_failure(error):
+        await interaction.followup.send(f"❌ Could not DM {user.mention}. They may have DMs disabled. The key `{key}` was saved to the dead-letter log.", ephemeral=True)
+
+    dm_queue.enqueue(user.id, embed, context={"key": key, "command": "sendkey"}, on_failure=notify_failure)
+    await interaction.response.send_message(f"✅ Key queued for delivery to {user.mention} via DM.", ephemeral=True)
 
 @bot.tree.command(name="redeem", description="Redeem a license key or ping key")
 @app_commands.describe(key="The key you want to redeem")
 @guild_only()
+@deferred()
 async def redeem(interaction: discord.Interaction, key: str):
-    valid_keys = load_json(VALID_KEYS_FILE)
-    user_db = load_json(USER_DB_FILE)
-    user_id = str(interaction.user.id)
+    wait = redeem_user_limiter.acquire(interaction.user.id) or redeem_guild_limiter.acquire(interaction.guild.id)
+    if wait:
+        await interaction.followup.send(f"⏳ You're redeeming keys too quickly. Try again in {math.ceil(wait)}s.", ephemeral=True)
+        return
 
-    if key not in valid_keys:
-        await interaction.response.send_message("❌ That key is invalid.", ephemeral=True)
+    if not key_filter.might_contain(key):
+        await interaction.followup.send("❌ That key is invalid.", ephemeral=True)
         return
 
-    key_data = valid_keys[key]
+    user_id = str(interaction.user.id)
+    async with user_locks.hold(user_id), key_locks.hold(key):
+        await redeem_locked(interaction, user_id, key)
+
+async def redeem_locked(interaction: discord.Interaction, user_id: str, key: str):
+    key_data = await store.get_key(key)
+
+    if key_data is None:
+        await interaction.followup.send("❌ That key is invalid.", ephemeral=True)
+        return
 
     if key_data["redeemed"]:
-        await interaction.response.send_message("❌ That key has already been redeemed.", ephemeral=True)
+        await interaction.followup.send("❌ That key has already been redeemed.", ephemeral=True)
         return
 
     if key_data.get("expiry") and datetime.fromisoformat(key_data["expiry"]) < datetime.utcnow():
-        await interaction.response.send_message("❌ That key has expired.", ephemeral=True)
+        await interaction.followup.send("❌ That key has expired.", ephemeral=True)
         return
 
     key_type = key_data.get("type", KEY_TYPE_LICENSE)
+    user_data = await store.get_user(user_id)
 
     if key_type in [KEY_TYPE_EVERYONE, KEY_TYPE_HERE]:
-        if user_id not in user_db or not user_db[user_id].get("active"):
-            await interaction.response.send_message("❌ You need an active slot to redeem ping keys.", ephemeral=True)
+        if user_data is None or not user_data.get("active"):
+            await interaction.followup.send("❌ You need an active slot to redeem ping keys.", ephemeral=True)
             return
 
         ping_field = "everyone_pings" if key_type == KEY_TYPE_EVERYONE else "here_pings"
         ping_label = "@everyone" if key_type == KEY_TYPE_EVERYONE else "@here"
 
-        valid_keys[key]["redeemed"] = True
-        valid_keys[key]["redeemed_by"] = user_id
-        valid_keys[key]["redeemed_at"] = datetime.utcnow().isoformat()
-        save_json(VALID_KEYS_FILE, valid_keys)
+        if not await store.redeem_key(key, user_id, datetime.utcnow().isoformat()):
+            await interaction.followup.send("❌ That key has already been redeemed.", ephemeral=True)
+            return
 
-        user_db[user_id][ping_field] = user_db[user_id].get(ping_field, 0) + 1
-        save_json(USER_DB_FILE, user_db)
+        ping_count = await store.add_pings(user_id, ping_field, 1)
 
         embed = build_embed(
             title="🔔 Ping Key Redeemed",
@@ -375,44 +639,49 @@ async def redeem(interaction: discord.Interaction, key: str):
                 f"Your **{ping_label} ping** key has been added to your slot!\n\n"
                 f"🏷️ **Key:** `{key}`\n"
                 f"📣 **Ping Type:** {ping_label}\n"
-                f"🔢 **{ping_label} Pings Available:** {user_db[user_id][ping_field]}\n\n"
+                f"🔢 **{ping_label} Pings Available:** {ping_count}\n\n"
                 f"Use `/ping` in your slot channel to use it."
             ),
             color=0xD2B48C
         )
-        try:
-            await interaction.user.send(embed=embed)
-            await interaction.response.send_message(f"✅ {ping_label} ping key redeemed! Check your DMs.", ephemeral=True)
-        except discord.Forbidden:
-            await interaction.response.send_message(f"✅ {ping_label} ping key redeemed! You now have {user_db[user_id][ping_field]} {ping_label} ping(s).", ephemeral=True)
+        dm_queue.enqueue(interaction.user.id, embed, context={"key": key, "command": "redeem"})
+        await interaction.followup.send(f"✅ {ping_label} ping key redeemed! You now have {ping_count} {ping_label} ping(s).", ephemeral=True)
         return
 
-    if user_id in user_db and user_db[user_id].get("active"):
-        await interaction.response.send_message("❌ You already have an active slot.", ephemeral=True)
+    if user_data is not None and user_data.get("active"):
+        await interaction.followup.send("❌ You already have an active slot.", ephemeral=True)
         return
 
     guild = interaction.guild
     category = guild.get_channel(SLOT_CATEGORY_ID)
 
     if category is None or not isinstance(category, discord.CategoryChannel):
-        await interaction.response.send_message("❌ Slot category not found. Please contact an admin.", ephemeral=True)
+        await interaction.followup.send("❌ Slot category not found. Please contact an admin.", ephemeral=True)
+        return
+
+    # The key is claimed before any channel exists and handed back if the
+    # channel can't be set up, so a key never yields two slots.
+    redeemed_at = datetime.utcnow().isoformat()
+    if not await store.redeem_key(key, user_id, redeemed_at):
+        await interaction.followup.send("❌ That key has already been redeemed.", ephemeral=True)
         return
 
     is_lifetime = key_type == KEY_TYPE_LICENSE_LIFETIME
     channel_name = f"{interaction.user.name.lower().replace(' ', '-')}-slot"
-    channel = await guild.create_text_channel(channel_name, category=category)
-    await apply_slot_permissions(channel, interaction.user, guild)
+    try:
+        channel = slot_pool.take()
+        if channel is not None:
+            await channel.edit(name=channel_name, overwrites=slot_overwrites(interaction.user, guild))
+        else:
+            channel = await guild.create_text_channel(channel_name, category=category, overwrites=slot_overwrites(interaction.user, guild))
+    except discord.HTTPException:
+        await store.release_key(key, user_id)
+        raise
 
-    redeemed_at = datetime.utcnow().isoformat()
     expiry_iso = None if is_lifetime else key_data["expiry"]
     duration_label = "Lifetime" if is_lifetime else f"{key_data['duration_days']} day(s)"
 
-    valid_keys[key]["redeemed"] = True
-    valid_keys[key]["redeemed_by"] = user_id
-    valid_keys[key]["redeemed_at"] = redeemed_at
-    save_json(VALID_KEYS_FILE, valid_keys)
-
-    user_db[user_id] = {
+    claimed = await store.claim_slot(user_id, {
         "username": str(interaction.user),
         "user_id": user_id,
         "active": True,
@@ -420,15 +689,20 @@ async def redeem(interaction: discord.Interaction, key: str):
         "redeemed_at": redeemed_at,
         "expiry": expiry_iso,
         "duration_days": "Lifetime" if is_lifetime else key_data["duration_days"],
-        "time_remaining": "Lifetime" if is_lifetime else time_remaining(expiry_iso),
         "slot_channel_id": str(channel.id),
         "slot_channel_name": channel_name,
         "guild_id": str(guild.id),
         "guild_name": guild.name,
         "everyone_pings": 0,
         "here_pings": 0
-    }
-    save_json(USER_DB_FILE, user_db)
+    })
+    if not claimed:
+        await store.release_key(key, user_id)
+        await channel.delete(reason="Slot claimed concurrently")
+        await interaction.followup.send("❌ You already have an active slot.", ephemeral=True)
+        return
+    if expiry_iso:
+        expiry_scheduler.schedule(user_id, iso_to_epoch(expiry_iso))
 
     await send_slot_created_embed(channel, interaction.user, redeemed_at, expiry_iso, duration_label)
 
@@ -445,37 +719,40 @@ async def redeem(interaction: discord.Interaction, key: str):
         color=0xD2B48C
     )
 
-    try:
-        await interaction.user.send(embed=dm_embed)
-        await interaction.response.send_message("✅ Key redeemed! Check your DMs for details.", ephemeral=True)
-    except discord.Forbidden:
-        await interaction.response.send_message(f"✅ Key redeemed! Your slot channel {channel.mention} has been created. (Enable DMs to receive confirmation)", ephemeral=True)
+    dm_queue.enqueue(interaction.user.id, dm_embed, context={"key": key, "command": "redeem"})
+    await interaction.followup.send(f"✅ Key redeemed! Your slot channel {channel.mention} has been created. Check your DMs for details.", ephemeral=True)
 
 @bot.tree.command(name="make-slot", description="Assign an existing channel as a lifetime slot for a user")
 @app_commands.describe(user="The user to assign the slot to", channel="The existing channel to use as their slot")
 @guild_only()
+@deferred()
 async def make_slot(interaction: discord.Interaction, user: discord.Member, channel: discord.TextChannel):
     if not is_admin(interaction.user.id):
-        await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
+        await interaction.followup.send("❌ You don't have permission to use this command.", ephemeral=True)
         return
 
-    user_db = load_json(USER_DB_FILE)
     user_id = str(user.id)
+    async with user_locks.hold(user_id):
+        await make_slot_locked(interaction, user, channel)
+
+async def make_slot_locked(interaction: discord.Interaction, user: discord.Member, channel: discord.TextChannel):
+    user_id = str(user.id)
+    user_data = await store.get_user(user_id)
 
-    if user_id in user_db and user_db[user_id].get("active"):
-        await interaction.response.send_message(f"❌ {user.mention} already has an active slot.", ephemeral=True)
+    if user_data is not None and user_data.get("active"):
+        await interaction.followup.send(f"❌ {user.mention} already has an active slot.", ephemeral=True)
         return
 
-    existing_uid, _ = find_user_by_channel(str(channel.id))
+    existing_uid, _ = await store.find_user_by_channel(str(channel.id))
     if existing_uid is not None:
-        await interaction.response.send_message("❌ That channel is already registered as a slot.", ephemeral=True)
+        await interaction.followup.send("❌ That channel is already registered as a slot.", ephemeral=True)
         return
 
-    await apply_slot_permissions(channel, user, interaction.guild)
+    await channel.edit(overwrites=merged_overwrites(channel, slot_overwrites(user, interaction.guild)))
 
     assigned_at = datetime.utcnow().isoformat()
 
-    user_db[user_id] = {
+    claimed = await store.claim_slot(user_id, {
         "username": str(user),
         "user_id": user_id,
         "active": True,
@@ -483,35 +760,33 @@ async def make_slot(interaction: discord.Interaction, user: discord.Member, chan
         "redeemed_at": assigned_at,
         "expiry": None,
         "duration_days": "Lifetime",
-        "time_remaining": "Lifetime",
         "slot_channel_id": str(channel.id),
         "slot_channel_name": channel.name,
         "guild_id": str(interaction.guild.id),
         "guild_name": interaction.guild.name,
         "everyone_pings": 0,
         "here_pings": 0
-    }
-    save_json(USER_DB_FILE, user_db)
+    })
+    if not claimed:
+        await interaction.followup.send(f"❌ {user.mention} already has an active slot.", ephemeral=True)
+        return
 
     await send_slot_created_embed(channel, user, assigned_at, None, "Lifetime")
 
-    try:
-        dm_embed = build_embed(
-            title=":rocket: **Lifetime Slot Activated**",
-            description=(
-                f"Hey {user.mention}, your **lifetime** slot has been set up by staff!\n\n"
-                f"Your dedicated channel is ready to go — use it to promote your products, services, or anything you'd like to share with the community.\n\n"
-                f"♾️ **Duration:** Lifetime\n"
-                f"📦 **Your Channel:** {channel.mention}\n\n"
-                f"Make the most of your slot and don't hesitate to reach out to staff if you need any assistance!"
-            ),
-            color=0xD2B48C
-        )
-        await user.send(embed=dm_embed)
-    except discord.Forbidden:
-        pass
+    dm_embed = build_embed(
+        title=":rocket: **Lifetime Slot Activated**",
+        description=(
+            f"Hey {user.mention}, your **lifetime** slot has been set up by staff!\n\n"
+            f"Your dedicated channel is ready to go — use it to promote your products, services, or anything you'd like to share with the community.\n\n"
+            f"♾️ **Duration:** Lifetime\n"
+            f"📦 **Your Channel:** {channel.mention}\n\n"
+            f"Make the most of your slot and don't hesitate to reach out to staff if you need any assistance!"
+        ),
+        color=0xD2B48C
+    )
+    dm_queue.enqueue(user.id, dm_embed, context={"command": "make-slot"})
 
-    await interaction.response.send_message(f"✅ {channel.mention} has been assigned as a lifetime slot for {user.mention}.", ephemeral=True)
+    await interaction.followup.send(f"✅ {channel.mention} has been assigned as a lifetime slot for {user.mention}.", ephemeral=True)
 
 @bot.tree.command(name="ping", description="Send a @here or @everyone ping in your slot channel")
 @app_commands.describe(type="The type of ping to send")
@@ -522,26 +797,23 @@ async def make_slot(interaction: discord.Interaction, user: discord.Member, chan
 @guild_only()
 async def ping(interaction: discord.Interaction, type: str):
     user_id = str(interaction.user.id)
-    user_db = load_json(USER_DB_FILE)
-
-    if user_id not in user_db or not user_db[user_id].get("active"):
-        await interaction.response.send_message("❌ You don't have an active slot.", ephemeral=True)
-        return
-
-    if str(interaction.channel_id) != user_db[user_id].get("slot_channel_id"):
-        await interaction.response.send_message("❌ You can only use `/ping` inside your own slot channel.", ephemeral=True)
-        return
-
     ping_field = "everyone_pings" if type == "everyone" else "here_pings"
     ping_label = "@everyone" if type == "everyone" else "@here"
-    current = user_db[user_id].get(ping_field, 0)
 
-    if current <= 0:
-        await interaction.response.send_message(f"❌ You have no **{ping_label}** pings remaining. Redeem a ping key to get more.", ephemeral=True)
-        return
+    async with user_locks.hold(user_id):
+        user_data = await store.get_user(user_id)
 
-    user_db[user_id][ping_field] = current - 1
-    save_json(USER_DB_FILE, user_db)
+        if user_data is None or not user_data.get("active"):
+            await interaction.response.send_message("❌ You don't have an active slot.", ephemeral=True)
+            return
+
+        if str(interaction.channel_id) != user_data.get("slot_channel_id"):
+            await interaction.response.send_message("❌ You can only use `/ping` inside your own slot channel.", ephemeral=True)
+            return
+
+        if await store.add_pings(user_id, ping_field, -1) is None:
+            await interaction.response.send_message(f"❌ You have no **{ping_label}** pings remaining. Redeem a ping key to get more.", ephemeral=True)
+            return
 
     await interaction.response.send_message("**Pinging...**")
     await interaction.channel.send("@here" if type == "here" else "@everyone")
@@ -550,17 +822,16 @@ async def ping(interaction: discord.Interaction, type: str):
 @guild_only()
 async def stats(interaction: discord.Interaction):
     user_id = str(interaction.user.id)
-    user_db = load_json(USER_DB_FILE)
+    data = await store.get_user(user_id)
 
-    if user_id not in user_db or not user_db[user_id].get("active"):
+    if data is None or not data.get("active"):
         await interaction.response.send_message("❌ You don't have an active slot.", ephemeral=True)
         return
 
-    if str(interaction.channel_id) != user_db[user_id].get("slot_channel_id"):
+    if str(interaction.channel_id) != data.get("slot_channel_id"):
         await interaction.response.send_message("❌ You can only view stats inside your own slot channel.", ephemeral=True)
         return
 
-    data = user_db[user_id]
     everyone_pings = data.get("everyone_pings", 0)
     here_pings = data.get("here_pings", 0)
     is_lifetime = data.get("duration_days") == "Lifetime"
@@ -577,7 +848,7 @@ async def stats(interaction: discord.Interaction):
         expiry_text = "♾️ **Never** — Lifetime slot"
     else:
         expiry_ts = int(datetime.fromisoformat(data["expiry"]).timestamp())
-        expiry_text = f"<t:{expiry_ts}:F> (<t:{expiry_ts}:R>)"
+        expiry_text = f"<t:{expiry_ts}:F> (<t:{expiry_ts}:R>)\n**Time Remaining:** {time_remaining(data['expiry'])}"
 
     embed = discord.Embed(
         title="📊 Slot Statistics",
@@ -616,20 +887,18 @@ async def addadmin(interaction: discord.Interaction, user: discord.Member):
         await interaction.response.send_message("❌ Only the main admin can add admins.", ephemeral=True)
         return
 
-    admins = load_json(ADMINS_FILE)
     uid = str(user.id)
 
-    if uid in admins:
-        await interaction.response.send_message(f"❌ {user.mention} is already an admin.", ephemeral=True)
-        return
-
-    admins[uid] = {
+    added = await store.add_admin(uid, {
         "username": str(user),
         "user_id": uid,
         "added_by": str(interaction.user.id),
         "added_at": datetime.utcnow().isoformat()
-    }
-    save_json(ADMINS_FILE, admins)
+    })
+    if not added:
+        await interaction.response.send_message(f"❌ {user.mention} is already an admin.", ephemeral=True)
+        return
+
     await interaction.response.send_message(f"✅ {user.mention} has been added as an admin.", ephemeral=True)
 
 @bot.tree.command(name="removeadmin", description="Remove a user from bot admins")
@@ -640,55 +909,67 @@ async def removeadmin(interaction: discord.Interaction, user: discord.Member):
         await interaction.response.send_message("❌ Only the main admin can remove admins.", ephemeral=True)
         return
 
-    admins = load_json(ADMINS_FILE)
     uid = str(user.id)
 
-    if uid not in admins:
+    if not await store.remove_admin(uid):
         await interaction.response.send_message(f"❌ {user.mention} is not an admin.", ephemeral=True)
         return
 
-    del admins[uid]
-    save_json(ADMINS_FILE, admins)
     await interaction.response.send_message(f"✅ {user.mention} has been removed from admins.", ephemeral=True)
 
 @bot.tree.command(name="terminateslot", description="Terminate a user's slot channel")
 @app_commands.describe(channel="The slot channel to terminate", reason="Reason for termination")
 @guild_only()
+@deferred()
 async def terminateslot(interaction: discord.Interaction, channel: discord.TextChannel, reason: str):
     if not is_admin(interaction.user.id):
-        await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
+        await interaction.followup.send("❌ You don't have permission to use this command.", ephemeral=True)
         return
 
-    user_id, user_data = find_user_by_channel(str(channel.id))
+    user_id, user_data = await store.find_user_by_channel(str(channel.id))
 
     if user_id is None:
-        await interaction.response.send_message("❌ That channel does not appear to be a registered slot channel.", ephemeral=True)
+        await interaction.followup.send("❌ That channel does not appear to be a registered slot channel.", ephemeral=True)
         return
 
-    guild = interaction.guild
-    slot_owner = guild.get_member(int(user_id))
-
-    await channel.set_permissions(guild.default_role, overwrite=discord.PermissionOverwrite(read_messages=False))
-    if slot_owner:
-        await channel.set_permissions(slot_owner, overwrite=discord.PermissionOverwrite(
-            read_messages=False,
-            send_messages=False,
-            embed_links=False,
-            attach_files=False,
-            add_reactions=False,
-            manage_channels=False,
-            manage_permissions=False,
-            manage_webhooks=False,
-            create_public_threads=False,
-            create_private_threads=False,
-            send_messages_in_threads=False,
-            mention_everyone=False,
-            view_channel=False
-        ))
-
     terminated_at = datetime.utcnow()
     deletion_time = terminated_at + timedelta(hours=8)
 
+    # The channel is locked before the slot is marked terminated, so if any
+    # Discord call fails the slot stays active and the command can be re-run.
+    guild = interaction.guild
+    async with user_locks.hold(user_id):
+        current = await store.get_user(user_id)
+        if current is None or not current.get("active") or current.get("slot_channel_id") != str(channel.id):
+            await interaction.followup.send("❌ That slot has already been terminated or has expired.", ephemeral=True)
+            return
+        slot_owner = await member_lru.get(guild, int(user_id))
+        await channel.edit(overwrites=merged_overwrites(channel, {
+            guild.default_role: HIDDEN_EVERYONE,
+            slot_owner or member_target(guild, int(user_id)): TERMINATED_OWNER
+        }))
+        terminated = await store.update_user_if(
+            user_id,
+            {"active": True, "slot_channel_id": str(channel.id)},
+            active=False,
+            terminated=True,
+            terminated_at=terminated_at.isoformat(),
+            terminated_by=str(interaction.user.id),
+            termination_reason=reason
+        )
+    if terminated is None:
+        await interaction.followup.send("❌ That slot has already been terminated or has expired.", ephemeral=True)
+        return
+    expiry_scheduler.cancel(user_id)
+
+    await deletion_queue.add(
+        str(channel.id),
+        deletion_time.isoformat(),
+        f"Slot terminated by {interaction.user} — {reason}",
+        channel_name=channel.name,
+        requested_by=str(interaction.user.id)
+    )
+
     termination_embed = discord.Embed(
         title="🚫 Slot Terminated",
         description=(
@@ -705,50 +986,152 @@ async def terminateslot(interaction: discord.Interaction, channel: discord.TextC
     termination_embed.set_thumbnail(url=THUMBNAIL_URL)
     termination_embed.set_footer(text=f"⏳ This slot channel will be permanently deleted in 8 hours • {FOOTER_TEXT}")
 
-    await channel.send(embed=termination_embed)
+    try:
+        await channel.send(embed=termination_embed)
+    except discord.HTTPException as e:
+        print(f"Posting the termination notice in {channel.name} failed: {e}")
 
-    user_db = load_json(USER_DB_FILE)
-    if user_id in user_db:
-        user_db[user_id]["active"] = False
-        user_db[user_id]["terminated"] = True
-        user_db[user_id]["terminated_at"] = terminated_at.isoformat()
-        user_db[user_id]["terminated_by"] = str(interaction.user.id)
-        user_db[user_id]["termination_reason"] = reason
-        save_json(USER_DB_FILE, user_db)
+    dm_embed = build_embed(
+        title="🚫 Your Slot Has Been Terminated",
+        description=(
+            f"Your slot in **{guild.name}** has been terminated by a staff member.\n\n"
+            f"**Reason:** {reason}\n"
+            f"**Terminated At:** <t:{int(terminated_at.timestamp())}:F>\n"
+            f"**Channel Deletion:** <t:{int(deletion_time.timestamp())}:R>\n\n"
+            f"If you believe this was a mistake, please reach out to the server staff."
+        ),
+        color=0xFF0000
+    )
+    dm_queue.enqueue(int(user_id), dm_embed, context={"command": "terminateslot"})
 
-    if slot_owner:
-        try:
-            dm_embed = build_embed(
-                title="🚫 Your Slot Has Been Terminated",
-                description=(
-                    f"Your slot in **{guild.name}** has been terminated by a staff member.\n\n"
-                    f"**Reason:** {reason}\n"
-                    f"**Terminated At:** <t:{int(terminated_at.timestamp())}:F>\n"
-                    f"**Channel Deletion:** <t:{int(deletion_time.timestamp())}:R>\n\n"
-                    f"If you believe this was a mistake, please reach out to the server staff."
-                ),
-                color=0xFF0000
-            )
-            await slot_owner.send(embed=dm_embed)
-        except discord.Forbidden:
-            pass
-
-    await interaction.response.send_message(f"✅ Slot `{channel.name}` has been terminated. The channel will be deleted in 8 hours.", ephemeral=True)
-
-    await asyncio.sleep(28800)
-    try:
-        await channel.delete(reason=f"Slot terminated by {interaction.user} — {reason}")
-    except discord.NotFound:
-        pass
+    await interaction.followup.send(f"✅ Slot `{channel.name}` has been terminated. The channel will be deleted in 8 hours.", ephemeral=True)
+
+@bot.tree.command(name="deletions", description="List or cancel pending slot channel deletions")
+@app_commands.describe(action="What to do with pending deletions", channel="The channel whose deletion should be cancelled")
+@app_commands.choices(action=[
+    app_commands.Choice(name="List", value="list"),
+    app_commands.Choice(name="Cancel", value="cancel"),
+])
+@guild_only()
+async def deletions(interaction: discord.Interaction, action: str, channel: discord.TextChannel = None):
+    if not is_admin(interaction.user.id):
+        await interaction.response.send_message("❌ You don't have permission to use this command.", ephemeral=True)
+        return
+
+    if action == "cancel":
+        if channel is None:
+            await interaction.response.send_message("❌ Choose the channel whose deletion you want to cancel.", ephemeral=True)
+            return
+        if await deletion_queue.cancel(str(channel.id)) is None:
+            await interaction.response.send_message(f"❌ {channel.mention} is not scheduled for deletion.", ephemeral=True)
+            return
+        await interaction.response.send_message(f"✅ Deletion of {channel.mention} has been cancelled.", ephemeral=True)
+        return
+
+    pending = deletion_queue.pending()
+    if not pending:
+        await interaction.response.send_message("✅ No channel deletions are pending.", ephemeral=True)
+        return
+
+    lines = [
+        f"<#{channel_id}> (`{job.get('channel_name', channel_id)}`) — <t:{int(iso_to_epoch(job['due']))}:R>"
+        for channel_id, job in pending[:25]
+    ]
+    if len(pending) > 25:
+        lines.append(f"…and {len(pending) - 25} more")
+    embed = build_embed(
+        title="🗑️ Pending Slot Deletions",
+        description="\n".join(lines),
+        color=0xFF4444
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="reconcile", description="Check slot records against the server's channels")
+@guild_only()
+@deferred()
+async def reconcile(interaction: discord.Interaction):
+    if not is_admin(interaction.user.id):
+        await interaction.followup.send("❌ You don't have permission to use this command.", ephemeral=True)
+        return
+
+    marked, unowned = await reconcile_slots(interaction.guild)
+    if not marked and not unowned:
+        await interaction.followup.send("✅ Slot records match the server's channels.", ephemeral=True)
+        return
+
+    lines = [f"🗑️ <@{user_id}> — channel `{channel_id}` no longer exists; slot marked inactive" for channel_id, user_id in marked.items()]
+    lines += [f"❓ {channel.mention} is in the slot category but has no slot owner" for channel in unowned]
+    if len(lines) > 25:
+        lines = lines[:25] + [f"…and {len(lines) - 25} more"]
+    embed = build_embed(
+        title="🔁 Slot Reconciliation",
+        description="\n".join(lines),
+        color=0xFFA500
+    )
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@bot.tree.command(name="synccommands", description="Force a re-upload of the bot's slash commands")
+@guild_only()
+@deferred()
+async def synccommands(interaction: discord.Interaction):
+    if not is_admin(interaction.user.id):
+        await interaction.followup.send("❌ You don't have permission to use this command.", ephemeral=True)
+        return
+
+    synced = await sync_if_changed(bot.tree, COMMAND_HASH_FILE, bot.application_id, force=True)
+    await interaction.followup.send(f"✅ Synced {len(synced)} command(s).", ephemeral=True)
+
+@bot.tree.command(name="audit", description="Look up a key or user, including archived history")
+@app_commands.describe(query="A key or user ID")
+@guild_only()
+@deferred()
+async def audit(interaction: discord.Interaction, query: str):
+    if not is_admin(interaction.user.id):
+        await interaction.followup.send("❌ You don't have permission to use this command.", ephemeral=True)
+        return
+
+    query = query.strip()
+    matches = []
+    key_data = await store.get_key(query)
+    if key_data is not None:
+        matches.append(("key", query, key_data))
+    user_data = await store.get_user(query)
+    if user_data is not None:
+        matches.append(("user", query, user_data))
+    matches += [
+        (f"archived {kind[:-1]}", ident, record)
+        for kind, ident, record in await asyncio.to_thread(lambda: list(itertools.islice(archive.lookup(query), 10)))
+    ]
+
+    if not matches:
+        await interaction.followup.send(f"❌ Nothing found for `{query}`.", ephemeral=True)
+        return
+
+    embed = build_embed(
+        title="🔎 Audit Lookup",
+        description=f"Results for `{query}`",
+        color=0xD2B48C
+    )
+    for label, ident, record in matches[:10]:
+        embed.add_field(name=f"{label} — {ident}"[:256], value=f"```json\n{json.dumps(record, indent=1)[:1000]}\n```", inline=False)
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    metrics.observe_command(interaction, "ok")
 
 @bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    metrics.observe_command(interaction, "check_failed" if isinstance(error, app_commands.CheckFailure) else "error")
     if isinstance(error, app_commands.CheckFailure):
         if not interaction.response.is_done():
             await interaction.response.send_message("❌ This command can only be used in a server.", ephemeral=True)
     else:
         if not interaction.response.is_done():
             await interaction.response.send_message("❌ An error occurred while running this command.", ephemeral=True)
+        else:
+            await interaction.followup.send("❌ An error occurred while running this command.", ephemeral=True)
         print(f"Command error: {error}")
 
-bot.run(TOKEN)
+if __name__ == '__main__':
+    bot.run(TOKEN)
@@ -0,0 +1,226 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BUILD_VERSION = 1
+SOURCE_FILE = os.path.join(os.path.dirname(__file__), 'website.html')
+DIST_DIR = os.path.join(os.path.dirname(__file__), 'dist')
+MANIFEST_FILE = 'manifest.json'
+
+_BLOCK_RE = re.compile(r'(<(script|style|pre|textarea)\b[^>]*>)(.*?)(</\2\s*>)', re.S | re.I)
+_HTML_COMMENT_RE = re.compile(r'<!--(?!\[if).*?-->', re.S)
+_WS_RE = re.compile(r'\s+')
+_CSS_TOKEN_RE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/|[^"\'/]+|/', re.S)
+_IDENT = set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$')
+# After these a "/" starts a regex literal rather than a division.
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+# A newline next to these can be dropped without changing automatic semicolon insertion.
+_NEWLINE_DROP_AFTER = set(';{,([=:?&|!')
+_NEWLINE_DROP_BEFORE = set('})],.;')
+
+
+def minify_css(css):
+    # Quoted strings are kept verbatim; everything between them has comments
+    # removed and whitespace collapsed around punctuation.
+    parts = ['']
+    for token in _CSS_TOKEN_RE.findall(css):
+        if token.startswith('/*'):
+            parts[-1] += ' '
+        elif token[0] in '"\'':
+            parts += [token, '']
+        else:
+            parts[-1] += token
+    for i in range(0, len(parts), 2):
+        code = _WS_RE.sub(' ', parts[i])
+        code = re.sub(r' ?([{};,>]) ?', r'\1', code)
+        parts[i] = code.replace(': ', ':').replace(';}', '}')
+    return ''.join(parts).strip()
+
+def _skip_string(js, i):
+    quote = js[i]
+    i += 1
+    while i < len(js) and js[i] != quote:
+        i += 2 if js[i] == '\\' else 1
+    return i + 1
+
+def _skip_regex(js, i):
+    i += 1
+    in_class = False
+    while i < len(js):
+        c = js[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            i += 1
+            break
+        i += 1
+    while i < len(js) and js[i] in _IDENT:
+        i += 1
+    return i
+
+def minify_js(js):
+    # Conservative: drops comments and collapses whitespace, keeping a newline
+    # wherever removing it could change automatic semicolon insertion. String,
+    # template and regex literals are copied verbatim.
+    out = []
+    pending_space = None
+    i = 0
+    while i < len(js):
+        c = js[i]
+        if c.isspace():
+            j = i
+            while j < len(js) and js[j].isspace():
+                j += 1
+            pending_space = '\n' if '\n' in js[i:j] or pending_space == '\n' else ' '
+            i = j
+            continue
+        if js.startswith('//', i):
+            i = js.find('\n', i)
+            i = len(js) if i < 0 else i
+            continue
+        if js.startswith('/*', i):
+            end = js.find('*/', i + 2)
+            i = len(js) if end < 0 else end + 2
+            pending_space = pending_space or ' '
+            continue
+
+        prev = out[-1][-1] if out else ''
+        if pending_space is not None and prev:
+            if pending_space == '\n' and prev not in _NEWLINE_DROP_AFTER and c not in _NEWLINE_DROP_BEFORE:
+                out.append('\n')
+            elif (prev in _IDENT and c in _IDENT) or (prev in '+-' and c in '+-'):
+                out.append(' ')
+        pending_space = None
+
+        if c in '"\'`':
+            j = _skip_string(js, i)
+        elif c == '/' and (not prev or prev in _REGEX_PRECEDERS):
+            j = _skip_regex(js, i)
+        else:
+            j = i + 1
+        out.append(js[i:j])
+        i = j
+    return ''.join(out)
+
+def minify_html(html, report=None):
+    # Whitespace runs outside script/style/pre/textarea collapse to one space;
+    # inline CSS and JS go through their own minifiers.
+    out = []
+    last = 0
+    for match in _BLOCK_RE.finditer(html):
+        out.append(_collapse_html(html[last:match.start()]))
+        open_tag, tag, body, close_tag = match.group(1), match.group(2).lower(), match.group(3), match.group(4)
+        if tag == 'style':
+            minified = minify_css(body)
+        elif tag == 'script' and 'src=' not in open_tag:
+            minified = minify_js(body).strip()
+        else:
+            minified = body
+        if report is not None and tag in ('style', 'script'):
+            name = 'css' if tag == 'style' else 'js'
+            before, after = report.get(name, (b'', b''))
+            report[name] = (before + body.encode(), after + minified.encode())
+        out.append(_WS_RE.sub(' ', open_tag) + minified + close_tag)
+        last = match.end()
+    out.append(_collapse_html(html[last:]))
+    return ''.join(out).strip()
+
+def _collapse_html(fragment):
+    return _WS_RE.sub(' ', _HTML_COMMENT_RE.sub('', fragment))
+
+def source_hash(source):
+    return hashlib.sha256(source + f"build-v{BUILD_VERSION}".encode()).hexdigest()
+
+def read_manifest(dist_dir):
+    path = os.path.join(dist_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def _write(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def build(source_path=SOURCE_FILE, dist_dir=DIST_DIR, force=False):
+    # Returns (manifest, report); report is None when the build was up to date.
+    with open(source_path, 'rb') as f:
+        source = f.read()
+    digest = source_hash(source)
+    manifest = read_manifest(dist_dir)
+    if not force and manifest is not None and manifest.get('source_hash') == digest:
+        return manifest, None
+
+    assets = {}
+    minified = minify_html(source.decode(), assets).encode()
+    assets['html'] = (source, minified)
+    content_hash = hashlib.sha256(minified).hexdigest()[:16]
+    stem, ext = os.path.splitext(os.path.basename(source_path))
+
+    variants = {'identity': minified, 'gzip': gzip.compress(minified, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(minified, quality=11)
+    suffixes = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+
+    os.makedirs(dist_dir, exist_ok=True)
+    files = {}
+    for encoding, body in variants.items():
+        name = f"{stem}.{content_hash}{ext}{suffixes[encoding]}"
+        _write(os.path.join(dist_dir, name), body)
+        files[encoding] = {"file": name, "bytes": len(body), "etag": f'"{content_hash}{suffixes[encoding].replace(".", "-")}"'}
+
+    manifest = {"source": os.path.basename(source_path), "source_hash": digest, "content_hash": content_hash, "variants": files}
+    _write(os.path.join(dist_dir, MANIFEST_FILE), json.dumps(manifest, indent=4).encode())
+    for name in os.listdir(dist_dir):
+        if name.startswith(stem + ".") and name != MANIFEST_FILE and content_hash not in name:
+            os.unlink(os.path.join(dist_dir, name))
+
+    report = {name: _sizes(before, after) for name, (before, after) in assets.items()}
+    return manifest, report
+
+def _sizes(source, minified):
+    sizes = {"source": len(source), "minified": len(minified), "gzip": len(gzip.compress(minified, compresslevel=9, mtime=0))}
+    if brotli is not None:
+        sizes["br"] = len(brotli.compress(minified, quality=11))
+    return sizes
+
+def print_report(report):
+    print(f"{'asset':<8}{'source':>10}{'minified':>10}{'saved':>8}{'gzip':>10}{'br':>10}")
+    for name, sizes in report.items():
+        source, minified = sizes["source"], sizes["minified"]
+        saved = f"{100 * (1 - minified / source):.0f}%" if source else "-"
+        gz = sizes["gzip"]
+        br = sizes.get("br", "-")
+        print(f"{name:<8}{source:>10}{minified:>10}{saved:>8}{gz:>10}{br:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Minify and precompress website.html into dist/")
+    parser.add_argument('--source', default=SOURCE_FILE)
+    parser.add_argument('--out', default=DIST_DIR)
+    parser.add_argument('--force', action='store_true', help="Rebuild even if the source is unchanged")
+    args = parser.parse_args()
+
+    manifest, report = build(args.source, args.out, args.force)
+    if report is None:
+        print(f"{manifest['variants']['identity']['file']} is up to date")
+        return
+    print_report(report)
+    print(f"Wrote {', '.join(entry['file'] for entry in manifest['variants'].values())} to {args.out}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import asyncio
+import hashlib
+import json
+import os
+
+from discord import app_commands
+
+
+def tree_hash(tree: app_commands.CommandTree, application_id):
+    # The payload sync() would upload (names, descriptions, options, choices,
+    # permissions), serialised canonically. The application ID is included so
+    # a token for a different application always syncs.
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda c: (c["type"], c["name"]))
+    data = json.dumps({"application_id": application_id, "commands": payload}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+def read_hash(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return f.read().strip()
+
+def write_hash(path, digest):
+    with open(path, 'w') as f:
+        f.write(digest + "\n")
+
+async def sync_if_changed(tree: app_commands.CommandTree, path, application_id, force=False):
+    # Returns the synced commands, or None if the stored hash already matched.
+    digest = tree_hash(tree, application_id)
+    if not force and await asyncio.to_thread(read_hash, path) == digest:
+        return None
+    synced = await tree.sync()
+    await asyncio.to_thread(write_hash, path, digest)
+    return synced
@@ -0,0 +1,136 @@
+import asyncio
+import json
+from collections import deque
+from datetime import datetime
+
+import aiohttp
+import discord
+
+import metrics
+
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+
+
+class DMJob:
+    __slots__ = ('user_id', 'embed', 'context', 'on_failure', 'attempts')
+
+    def __init__(self, user_id, embed, context, on_failure):
+        self.user_id = user_id
+        self.embed = embed
+        self.context = context
+        self.on_failure = on_failure
+        self.attempts = 0
+
+
+class DMQueue:
+    # Outbound DMs are queued per recipient and sent by a fixed pool of workers.
+    # A recipient's messages are always sent by one worker at a time, in order.
+    # Rate limits and server errors are retried with exponential backoff; DMs
+    # that still cannot be delivered are appended to a JSONL dead-letter file.
+
+    def __init__(self, client: discord.Client, dead_letter_path, workers=4, max_attempts=5):
+        self.client = client
+        self.dead_letter_path = dead_letter_path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._pending = {}
+        self._ready = asyncio.Queue()
+        self._tasks = []
+
+    def __len__(self):
+        return sum(len(jobs) for jobs in self._pending.values())
+
+    def enqueue(self, user_id: int, embed: discord.Embed, context=None, on_failure=None):
+        jobs = self._pending.get(user_id)
+        if jobs is None:
+            jobs = self._pending[user_id] = deque()
+            self._ready.put_nowait(user_id)
+        jobs.append(DMJob(user_id, embed, context or {}, on_failure))
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for jobs in self._pending.values():
+            for job in jobs:
+                await self._dead_letter(job, "Bot shut down before delivery", "shutdown")
+        self._pending.clear()
+
+    async def _worker(self):
+        while True:
+            user_id = await self._ready.get()
+            jobs = self._pending[user_id]
+            while jobs:
+                # Any failure, including a failed dead-letter write, only costs
+                # this job. A cancelled job stays queued for close() to record.
+                try:
+                    await self._deliver(jobs[0])
+                except Exception as e:
+                    print(f"DM to {user_id} could not be delivered or dead-lettered: {e!r}")
+                jobs.popleft()
+            del self._pending[user_id]
+
+    async def _deliver(self, job: DMJob):
+        while True:
+            job.attempts += 1
+            try:
+                user = self.client.get_user(job.user_id) or await self.client.fetch_user(job.user_id)
+                await user.send(embed=job.embed)
+                return
+            except (discord.Forbidden, discord.NotFound) as e:
+                await self._fail(job, e)
+                return
+            except discord.HTTPException as e:
+                retryable = e.status == 429 or e.status >= 500
+                if not retryable or job.attempts >= self.max_attempts:
+                    await self._fail(job, e)
+                    return
+            except (OSError, aiohttp.ClientError) as e:
+                # Connection errors and timeouts left over after discord.py's own retries.
+                if job.attempts >= self.max_attempts:
+                    await self._fail(job, e)
+                    return
+            except Exception as e:
+                await self._fail(job, e)
+                return
+            metrics.dm_retries.inc()
+            delay = min(RETRY_BASE_SECONDS * 2 ** (job.attempts - 1), RETRY_MAX_SECONDS)
+            await asyncio.sleep(delay)
+
+    async def _fail(self, job: DMJob, error):
+        if isinstance(error, discord.Forbidden):
+            kind = "forbidden"
+        elif isinstance(error, discord.NotFound):
+            kind = "not_found"
+        elif isinstance(error, discord.HTTPException):
+            kind = f"http_{error.status}"
+        else:
+            kind = type(error).__name__
+        await self._dead_letter(job, str(error) or repr(error), kind)
+        if job.on_failure is not None:
+            try:
+                await job.on_failure(error)
+            except Exception as e:
+                print(f"DM failure callback for {job.user_id} raised: {e!r}")
+
+    async def _dead_letter(self, job: DMJob, reason, kind):
+        metrics.dm_failures.inc(reason=kind)
+        record = {
+            "user_id": str(job.user_id),
+            "failed_at": datetime.utcnow().isoformat(),
+            "attempts": job.attempts,
+            "reason": reason,
+            "context": job.context,
+            "embed": job.embed.to_dict()
+        }
+        await asyncio.to_thread(self._append_dead_letter, json.dumps(record))
+
+    def _append_dead_letter(self, line):
+        with open(self.dead_letter_path, 'a') as f:
+            f.write(line + "\n")
@@ -0,0 +1,30 @@
+import functools
+
+import discord
+
+import metrics
+
+
+def _elapsed(interaction: discord.Interaction):
+    # Measured from the interaction's snowflake time, which is when Discord's
+    # 3 second initial-response window started.
+    return (discord.utils.utcnow() - interaction.created_at).total_seconds()
+
+def deferred(ephemeral=True):
+    # Acknowledge the interaction before doing any work; the command must then
+    # reply through interaction.followup instead of interaction.response.
+    # Acknowledgement latency and missed deadlines are reported in metrics.
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(interaction: discord.Interaction, *args, **kwargs):
+            name = interaction.command.name if interaction.command else func.__name__
+            try:
+                await interaction.response.defer(ephemeral=ephemeral)
+            except discord.NotFound:
+                metrics.command_missed_deadline.inc(command=name)
+                print(f"[Deadline] /{name} missed the response deadline after {_elapsed(interaction):.2f}s")
+                return
+            metrics.command_ack_seconds.observe(_elapsed(interaction), command=name)
+            return await func(interaction, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import os
+
+import metrics
+
+SEGMENT_SUFFIX = '.jsonl'
+
+
+def _segment_number(name):
+    stem, suffix = os.path.splitext(name)
+    if suffix != SEGMENT_SUFFIX or not stem.isdigit():
+        return None
+    return int(stem)
+
+def read_segment(path):
+    # A crash can leave the last line half-written; everything before it is intact.
+    entries = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return entries
+
+
+class Journal:
+    # Append-only write-ahead log kept as numbered JSONL segments in one
+    # directory. Appends are buffered and a single writer task commits them in
+    # groups with one fsync per group, so concurrent mutations share the cost.
+    # rotate() starts a new segment; once a snapshot covers every sealed
+    # segment they are removed with discard_before().
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.segment = 1
+        self.size = 0
+        self._buffer = []
+        self._waiters = []
+        self._wakeup = asyncio.Event()
+        self._file = None
+        self._file_segment = None
+        self._task = None
+        self._replayed = False
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:08d}{SEGMENT_SUFFIX}")
+
+    def segments(self):
+        if not os.path.isdir(self.directory):
+            return []
+        numbers = (_segment_number(name) for name in os.listdir(self.directory))
+        return sorted(n for n in numbers if n is not None)
+
+    def replay(self):
+        # Returns every committed entry in order. New appends go to a fresh
+        # segment so a torn tail is never extended.
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self.segments()
+        entries = []
+        for segment in segments:
+            entries.extend(read_segment(self._path(segment)))
+        self.segment = segments[-1] + 1 if segments else 1
+        self._replayed = True
+        return entries
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._writer())
+
+    async def close(self):
+        if self._task is not None:
+            await self.sync()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._file is not None:
+            await asyncio.to_thread(self._close_file)
+
+    @staticmethod
+    def encode(op, **fields):
+        return json.dumps({"op": op, **fields}) + "\n"
+
+    def append(self, op, **fields):
+        # The returned future resolves once the entry is on disk.
+        return self.append_line(self.encode(op, **fields))
+
+    def append_line(self, line):
+        # For entries serialised with encode() off the event loop.
+        self.size += len(line)
+        metrics.store_bytes.inc(len(line), op='append', table='journal')
+        self._buffer.append((self.segment, line))
+        return self.sync()
+
+    def sync(self):
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._wakeup.set()
+        return waiter
+
+    def rotate(self):
+        # Returns the first segment not covered by a snapshot taken right now.
+        self.segment += 1
+        self.size = 0
+        return self.segment
+
+    async def discard_before(self, segment):
+        if not self._replayed:
+            # Segment numbers are only known after replay(); nothing can be
+            # covered by a snapshot yet.
+            return
+        if self._task is not None:
+            await self.sync()
+        await asyncio.to_thread(self._discard, segment)
+
+    def _discard(self, segment):
+        for number in self.segments():
+            if number < segment:
+                os.unlink(self._path(number))
+
+    def _close_file(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._file_segment = None
+
+    def _write(self, batch):
+        for segment, line in batch:
+            if segment != self._file_segment:
+                if self._file is not None:
+                    self._close_file()
+                self._file = open(self._path(segment), 'a')
+                self._file_segment = segment
+            self._file.write(line)
+        if self._file is None:
+            return
+        if self._file_segment < self.segment:
+            # Sealed by rotate(); close it so discard_before() can remove it.
+            self._close_file()
+        else:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    async def _writer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            batch, self._buffer = self._buffer, []
+            waiters, self._waiters = self._waiters, []
+            try:
+                with metrics.timed(metrics.store_seconds, op='commit', table='journal'):
+                    await asyncio.to_thread(self._write, batch)
+            except OSError as e:
+                print(f"Journal write failed: {e}")
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
@@ -0,0 +1,68 @@
+import asyncio
+import csv
+import io
+import itertools
+import secrets
+import string
+
+KEY_PREFIX = "Shampoo-MP-"
+MAX_KEYS_PER_BATCH = 100000
+
+LETTERS = string.ascii_uppercase
+DIGITS = string.digits
+# Every placement of the 4 letters among the 8 key characters.
+LETTER_LAYOUTS = [frozenset(c) for c in itertools.combinations(range(8), 4)]
+
+def _random_bytes():
+    while True:
+        yield from secrets.token_bytes(4096)
+
+def _uniform(stream, n):
+    # Rejection sampling keeps byte -> [0, n) free of modulo bias.
+    limit = 256 - 256 % n
+    for b in stream:
+        if b < limit:
+            return b % n
+
+def _draw_key(stream):
+    letters = [LETTERS[_uniform(stream, 26)] for _ in range(4)]
+    digits = [DIGITS[_uniform(stream, 10)] for _ in range(4)]
+    layout = LETTER_LAYOUTS[_uniform(stream, len(LETTER_LAYOUTS))]
+    chars = [letters.pop() if i in layout else digits.pop() for i in range(8)]
+    return f"{KEY_PREFIX}{''.join(chars)}"
+
+def generate_keys(count, exclude=frozenset()):
+    stream = _random_bytes()
+    keys = {}
+    while len(keys) < count:
+        key = _draw_key(stream)
+        if key not in exclude:
+            keys[key] = None
+    return list(keys)
+
+async def mint_keys(store, count):
+    # Candidates are drawn off the event loop, then checked against the store
+    # as one set; only the colliding ones are redrawn.
+    keys = await asyncio.to_thread(generate_keys, count)
+    while True:
+        taken = await store.existing_keys(keys)
+        if not taken:
+            return keys
+        kept = [key for key in keys if key not in taken]
+        keys = kept + await asyncio.to_thread(generate_keys, len(taken), set(keys))
+
+def build_key_records(keys, template):
+    return {key: dict(template) for key in keys}
+
+def render_keys_file(keys, template, file_format):
+    buffer = io.StringIO()
+    if file_format == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(["key", "type", "duration_days", "expiry", "generated_at"])
+        columns = [template["type"], template["duration_days"] or "", template["expiry"] or "", template["generated_at"]]
+        for key in keys:
+            writer.writerow([key] + columns)
+    else:
+        for key in keys:
+            buffer.write(key + "\n")
+    return buffer.getvalue().encode()
@@ -0,0 +1,442 @@
+import re
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from datetime import datetime, timezone
+
+from keygen import KEY_PREFIX
+
+KEY_TYPES = ["license", "license_lifetime", "everyone_ping", "here_ping"]
+KEY_TYPE_CODES = {name: code for code, name in enumerate(KEY_TYPES)}
+
+FIELDS = ("type", "duration_days", "expiry", "generated_at", "generated_by", "sent_to", "redeemed", "redeemed_by", "redeemed_at")
+
+NO_TIME = -(1 << 63)
+NO_DURATION = -1
+LIFETIME_DURATION = -2
+NO_SENT_TO = -1
+
+_KEY_RE = re.compile(re.escape(KEY_PREFIX) + r"[0-9A-Z]{8}")
+_DIGITS36 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+_COLUMNS = (
+    ("ids", "q"),
+    ("types", "b"),
+    ("redeemed", "b"),
+    ("durations", "i"),
+    ("expiry", "q"),
+    ("generated_at", "q"),
+    ("generated_by", "q"),
+    ("sent_to", "q"),
+    ("redeemed_by", "q"),
+    ("redeemed_at", "q"),
+)
+
+
+class _Uncompactable(Exception):
+    pass
+
+
+def pack_key(key):
+    # Shampoo-MP-XXXXXXXX: 8 base-36 digits fit losslessly in an int64.
+    if not _KEY_RE.fullmatch(key):
+        return None
+    return int(key[len(KEY_PREFIX):], 36)
+
+def unpack_key(packed):
+    chars = []
+    for _ in range(8):
+        packed, digit = divmod(packed, 36)
+        chars.append(_DIGITS36[digit])
+    return KEY_PREFIX + "".join(reversed(chars))
+
+def _encode_time(iso):
+    if iso is None:
+        return NO_TIME
+    if not isinstance(iso, str):
+        raise _Uncompactable
+    dt = datetime.fromisoformat(iso)
+    if dt.tzinfo is not None:
+        raise _Uncompactable
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+def _decode_time(value):
+    if value == NO_TIME:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None).isoformat()
+
+def _encode_id(value):
+    if value is None:
+        return 0
+    if not isinstance(value, str) or not value.isdigit() or str(int(value)) != value or int(value) >= 1 << 63:
+        raise _Uncompactable
+    return int(value)
+
+def _decode_id(value):
+    return None if value == 0 else str(value)
+
+def _encode_duration(value):
+    if value is None:
+        return NO_DURATION
+    if value == "Lifetime":
+        return LIFETIME_DURATION
+    if type(value) is not int or not 0 <= value < 1 << 31:
+        raise _Uncompactable
+    return value
+
+def _decode_duration(value):
+    if value == NO_DURATION:
+        return None
+    if value == LIFETIME_DURATION:
+        return "Lifetime"
+    return value
+
+def _encode(record):
+    if set(record) | {"sent_to"} != set(FIELDS) or record.get("type") not in KEY_TYPE_CODES:
+        raise _Uncompactable
+    if "sent_to" in record:
+        sent_to = _encode_id(record["sent_to"])
+        if sent_to == 0:
+            raise _Uncompactable
+    else:
+        sent_to = NO_SENT_TO
+    redeemed = record.get("redeemed")
+    if redeemed not in (True, False):
+        raise _Uncompactable
+    return (
+        KEY_TYPE_CODES[record["type"]],
+        1 if redeemed else 0,
+        _encode_duration(record.get("duration_days")),
+        _encode_time(record.get("expiry")),
+        _encode_time(record.get("generated_at")),
+        _encode_id(record.get("generated_by")),
+        sent_to,
+        _encode_id(record.get("redeemed_by")),
+        _encode_time(record.get("redeemed_at")),
+    )
+
+
+class KeyTable:
+    # Dict-like store of key records kept as parallel typed arrays: packed key
+    # IDs, type/status enums and epoch-second timestamps, roughly 90 bytes per
+    # key instead of a 10-field dict. Lookups go through an open-addressing
+    # hash index of row numbers; full record dicts are only built on demand.
+    # Records that don't fit the columns (other key formats, unknown fields)
+    # are kept as plain dicts in `extra`. Timestamps are stored to the second.
+
+    def __init__(self):
+        for name, typecode in _COLUMNS:
+            setattr(self, name, array(typecode))
+        self.extra = {}
+        self._slots = array("q", bytes(8 * 16))
+        self._shift = 64 - 4
+
+    @classmethod
+    def from_records(cls, records):
+        table = cls()
+        table.update(records)
+        return table
+
+    def copy(self):
+        table = KeyTable.__new__(KeyTable)
+        for name, _ in _COLUMNS:
+            setattr(table, name, getattr(self, name)[:])
+        table.extra = dict(self.extra)
+        table._slots = self._slots[:]
+        table._shift = self._shift
+        return table
+
+    # Hash index
+
+    def _home(self, packed):
+        return ((packed * _HASH_MULTIPLIER) & _MASK64) >> self._shift
+
+    def _probe(self, packed):
+        slots, ids = self._slots, self.ids
+        mask = len(slots) - 1
+        i = self._home(packed)
+        while True:
+            row = slots[i] - 1
+            if row < 0 or ids[row] == packed:
+                return i, row
+            i = (i + 1) & mask
+
+    def _grow(self, min_rows=0):
+        size = len(self._slots) * 2
+        while size < 2 * min_rows:
+            size *= 2
+        self._slots = array("q", bytes(8 * size))
+        self._shift = 64 - (size.bit_length() - 1)
+        mask = size - 1
+        for row, packed in enumerate(self.ids):
+            i = self._home(packed)
+            while self._slots[i]:
+                i = (i + 1) & mask
+            self._slots[i] = row + 1
+
+    def _unlink_slot(self, i):
+        # Backward-shift deletion keeps linear probe chains intact without tombstones.
+        slots, ids = self._slots, self.ids
+        mask = len(slots) - 1
+        j = i
+        while True:
+            j = (j + 1) & mask
+            row = slots[j] - 1
+            if row < 0:
+                break
+            home = self._home(ids[row])
+            if (i <= j and i < home <= j) or (i > j and (home > i or home <= j)):
+                continue
+            slots[i] = slots[j]
+            i = j
+        slots[i] = 0
+
+    def _row(self, key):
+        packed = pack_key(key)
+        if packed is None:
+            return None, -1
+        return packed, self._probe(packed)[1]
+
+    # Mapping interface
+
+    def __len__(self):
+        return len(self.ids) + len(self.extra)
+
+    def __contains__(self, key):
+        if key in self.extra:
+            return True
+        return self._row(key)[1] >= 0
+
+    def __iter__(self):
+        for packed in self.ids:
+            yield unpack_key(packed)
+        yield from self.extra
+
+    def _record(self, row):
+        record = {
+            "type": KEY_TYPES[self.types[row]],
+            "duration_days": _decode_duration(self.durations[row]),
+            "expiry": _decode_time(self.expiry[row]),
+            "generated_at": _decode_time(self.generated_at[row]),
+            "generated_by": _decode_id(self.generated_by[row]),
+        }
+        if self.sent_to[row] != NO_SENT_TO:
+            record["sent_to"] = _decode_id(self.sent_to[row])
+        record["redeemed"] = bool(self.redeemed[row])
+        record["redeemed_by"] = _decode_id(self.redeemed_by[row])
+        record["redeemed_at"] = _decode_time(self.redeemed_at[row])
+        return record
+
+    def get(self, key, default=None):
+        if key in self.extra:
+            return self.extra[key]
+        row = self._row(key)[1]
+        return self._record(row) if row >= 0 else default
+
+    def __getitem__(self, key):
+        record = self.get(key)
+        if record is None:
+            raise KeyError(key)
+        return record
+
+    def items(self):
+        for row, packed in enumerate(self.ids):
+            yield unpack_key(packed), self._record(row)
+        yield from self.extra.items()
+
+    def __setitem__(self, key, record):
+        packed = pack_key(key)
+        try:
+            if packed is None:
+                raise _Uncompactable
+            values = _encode(record)
+        except (_Uncompactable, ValueError):
+            self.pop(key, None)
+            self.extra[key] = record
+            return
+        self.extra.pop(key, None)
+        self._store(packed, values)
+
+    def _store(self, packed, values):
+        i, row = self._probe(packed)
+        if row >= 0:
+            for (name, _), value in zip(_COLUMNS[1:], values):
+                getattr(self, name)[row] = value
+            return
+        self.ids.append(packed)
+        for (name, _), value in zip(_COLUMNS[1:], values):
+            getattr(self, name).append(value)
+        self._slots[i] = len(self.ids)
+        if len(self.ids) * 2 > len(self._slots):
+            self._grow()
+
+    def update(self, records):
+        for key, record in records.items():
+            self[key] = record
+
+    def add_batch(self, keys, template):
+        # Every key shares one record layout, so it is encoded once, new IDs are
+        # indexed in one pass and the other columns grow by a single extend.
+        try:
+            values = _encode(template)
+        except (_Uncompactable, ValueError):
+            values = None
+        if values is None:
+            for key in keys:
+                self[key] = dict(template)
+            return
+
+        # Repeats within the batch are dropped first, so every row matched below
+        # predates the batch and already has all of its columns.
+        keys = list(dict.fromkeys(keys))
+        start = len(self.ids)
+        if (start + len(keys)) * 2 > len(self._slots):
+            self._grow(start + len(keys))
+        slots, ids, extra = self._slots, self.ids, self.extra
+        mask, shift = len(slots) - 1, self._shift
+        leftovers = []
+        for key in keys:
+            packed = pack_key(key)
+            if packed is None:
+                leftovers.append(key)
+                continue
+            if extra:
+                extra.pop(key, None)
+            i = ((packed * _HASH_MULTIPLIER) & _MASK64) >> shift
+            while True:
+                row = slots[i] - 1
+                if row < 0:
+                    ids.append(packed)
+                    slots[i] = len(ids)
+                    break
+                if ids[row] == packed:
+                    self._store(packed, values)
+                    break
+                i = (i + 1) & mask
+
+        added = len(ids) - start
+        for (name, typecode), value in zip(_COLUMNS[1:], values):
+            getattr(self, name).extend(array(typecode, [value]) * added)
+        for key in leftovers:
+            self[key] = dict(template)
+
+    def pop(self, key, default=None):
+        if key in self.extra:
+            return self.extra.pop(key)
+        packed = pack_key(key)
+        if packed is None:
+            return default
+        i, row = self._probe(packed)
+        if row < 0:
+            return default
+        record = self._record(row)
+        self._unlink_slot(i)
+        last = len(self.ids) - 1
+        if row != last:
+            j, _ = self._probe(self.ids[last])
+            for name, _ in _COLUMNS:
+                column = getattr(self, name)
+                column[row] = column[last]
+            self._slots[j] = row + 1
+        for name, _ in _COLUMNS:
+            getattr(self, name).pop()
+        return record
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.pop(key)
+
+    # Column-level operations
+
+    def unredeemed(self):
+        for packed, redeemed in zip(self.ids, self.redeemed):
+            if not redeemed:
+                yield unpack_key(packed)
+        for key, record in self.extra.items():
+            if not record.get("redeemed"):
+                yield key
+
+    def redeemed_before(self, cutoff):
+        # Keys redeemed strictly before the naive-UTC ISO timestamp cutoff.
+        limit = _encode_time(cutoff)
+        for packed, redeemed, redeemed_at in zip(self.ids, self.redeemed, self.redeemed_at):
+            if redeemed and NO_TIME < redeemed_at < limit:
+                yield unpack_key(packed)
+        for key, record in self.extra.items():
+            redeemed_at = record.get("redeemed_at")
+            if record.get("redeemed") and isinstance(redeemed_at, str) and redeemed_at < cutoff:
+                yield key
+
+    def redeem(self, key, user_id, redeemed_at):
+        # Compare-and-set on the redeemed flag without building the record.
+        if key in self.extra:
+            record = self.extra[key]
+            if record.get("redeemed"):
+                return False
+            self.extra[key] = {**record, "redeemed": True, "redeemed_by": user_id, "redeemed_at": redeemed_at}
+            return True
+        row = self._row(key)[1]
+        if row < 0 or self.redeemed[row]:
+            return False
+        try:
+            redeemed_by, redeemed_ts = _encode_id(user_id), _encode_time(redeemed_at)
+        except (_Uncompactable, ValueError):
+            record = self.pop(key)
+            self.extra[key] = {**record, "redeemed": True, "redeemed_by": user_id, "redeemed_at": redeemed_at}
+            return True
+        self.redeemed[row] = 1
+        self.redeemed_by[row] = redeemed_by
+        self.redeemed_at[row] = redeemed_ts
+        return True
+
+    def release(self, key, user_id):
+        # Undoes a redeem, but only the one made by user_id.
+        record = self.get(key)
+        if record is None or not record["redeemed"] or record["redeemed_by"] != user_id:
+            return False
+        self[key] = {**record, "redeemed": False, "redeemed_by": None, "redeemed_at": None}
+        return True
+
+
+class RetiredKeys:
+    # Keys whose records were archived, kept only so they are never issued
+    # again: packed IDs in one sorted int64 array, other key formats as
+    # strings. Persisted as {"ids": [...], "other": [...]}.
+
+    def __init__(self, ids=(), other=()):
+        self.ids = array("q", ids)
+        self.other = set(other)
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(sorted(record.get("ids", ())), record.get("other", ()))
+
+    def copy(self):
+        return RetiredKeys(self.ids, self.other)
+
+    def items(self):
+        return [("ids", self.ids.tolist()), ("other", sorted(self.other))]
+
+    def __len__(self):
+        return len(self.ids) + len(self.other)
+
+    def __contains__(self, key):
+        packed = pack_key(key)
+        if packed is None:
+            return key in self.other
+        i = bisect_left(self.ids, packed)
+        return i < len(self.ids) and self.ids[i] == packed
+
+    def add_many(self, keys):
+        packed = []
+        for key in keys:
+            value = pack_key(key)
+            if value is None:
+                self.other.add(key)
+            elif key not in self:
+                packed.append(value)
+        if packed:
+            self.ids = array("q", merge(self.ids, sorted(set(packed))))
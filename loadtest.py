@@ -0,0 +1,50 @@
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+
+async def worker(session, url, headers, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            async with session.get(url, headers=headers) as response:
+                await response.read()
+                if response.status >= 400:
+                    errors.append(response.status)
+                    continue
+        except aiohttp.ClientError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+async def run(url, concurrency, duration, encoding, keep_alive):
+    headers = {"Accept-Encoding": encoding} if encoding else {"Accept-Encoding": "identity"}
+    connector = aiohttp.TCPConnector(limit=concurrency, force_close=not keep_alive)
+    latencies, errors = [], []
+    async with aiohttp.ClientSession(connector=connector, auto_decompress=False) as session:
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session, url, headers, deadline, latencies, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{url}  concurrency={concurrency}  encoding={encoding or 'identity'}  keep-alive={'on' if keep_alive else 'off'}")
+    print(f"  {len(latencies)} requests in {elapsed:.1f}s = {len(latencies) / elapsed:.0f} req/s, {len(errors)} errors")
+    if latencies:
+        p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+        print(f"  latency ms: p50 {p(0.5):.1f}  p90 {p(0.9):.1f}  p99 {p(0.99):.1f}  max {latencies[-1] * 1000:.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure requests/sec against the website server")
+    parser.add_argument('url', nargs='?', default='http://localhost:3000/')
+    parser.add_argument('-c', '--concurrency', type=int, default=50)
+    parser.add_argument('-d', '--duration', type=float, default=10)
+    parser.add_argument('-e', '--encoding', default='', help="Accept-Encoding to send, e.g. gzip or br")
+    parser.add_argument('--no-keepalive', action='store_true', help="Open a new connection per request")
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.concurrency, args.duration, args.encoding, not args.no_keepalive))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class StripedLocks:
+    # A fixed set of asyncio locks shared out by hash of the ID, so memory stays
+    # bounded however many users or keys exist. Two IDs only contend when they
+    # land on the same stripe, which with the default count is rare.
+
+    def __init__(self, stripes=1024):
+        self._locks = [asyncio.Lock() for _ in range(stripes)]
+
+    def __call__(self, item):
+        return self._locks[hash(item) % len(self._locks)]
+
+    @asynccontextmanager
+    async def hold(self, *items):
+        # Stripes are taken in index order so overlapping holders can't deadlock.
+        indexes = sorted({hash(item) % len(self._locks) for item in items})
+        acquired = []
+        try:
+            for i in indexes:
+                await self._locks[i].acquire()
+                acquired.append(self._locks[i])
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
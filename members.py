@@ -0,0 +1,32 @@
+from collections import OrderedDict
+
+import discord
+
+
+class MemberLRU:
+    # Members fetched on demand when they aren't in discord.py's member cache
+    # (e.g. with chunking disabled), kept in a small LRU keyed by
+    # (guild_id, user_id). Members who have left resolve to None.
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._members = OrderedDict()
+
+    async def get(self, guild: discord.Guild, user_id: int):
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+        key = (guild.id, user_id)
+        member = self._members.pop(key, None)
+        if member is None:
+            try:
+                member = await guild.fetch_member(user_id)
+            except discord.NotFound:
+                return None
+        self._members[key] = member
+        if len(self._members) > self.max_entries:
+            self._members.popitem(last=False)
+        return member
+
+    def discard(self, guild_id, user_id):
+        self._members.pop((guild_id, user_id), None)
@@ -0,0 +1,213 @@
+import math
+import os
+import time
+from contextlib import contextmanager
+
+import aiohttp
+import discord
+from discord import app_commands
+
+METRICS_FILE = 'database/metrics.prom'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    # One metric family in the Prometheus text format. Families that have never
+    # been touched render nothing, so the bot and the standalone web server can
+    # share this module without emitting each other's empty families.
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self.samples = {}
+        registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = self.render_samples()
+        if not lines:
+            return []
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"] + lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.samples[key] = self.samples.get(key, 0) + amount
+
+    def render_samples(self):
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in sorted(self.samples.items())]
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, labels)
+        self._function = None
+
+    def set(self, value, **labels):
+        self.samples[self._key(labels)] = value
+
+    def set_function(self, function):
+        # Evaluated at render time, for values owned by another object.
+        self._function = function
+
+    def render_samples(self):
+        samples = dict(self.samples)
+        if self._function is not None:
+            samples[()] = self._function()
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in sorted(samples.items())]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        sample = self.samples.get(key)
+        if sample is None:
+            sample = self.samples[key] = [[0] * len(self.buckets), 0.0, 0]
+        counts = sample[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        sample[1] += value
+        sample[2] += 1
+
+    def render_samples(self):
+        lines = []
+        for key, (counts, total, count) in sorted(self.samples.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _labels(self.label_names, key, [("le", _number(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+@contextmanager
+def timed(histogram, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n" if lines else ""
+
+def write_exposition(path, text):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def read_exposition(path):
+    if not os.path.exists(path):
+        return ""
+    with open(path, 'r') as f:
+        return f.read()
+
+
+command_seconds = Histogram('shampoo_command_duration_seconds', "Slash command run time from dispatch to return.", ('command', 'status'))
+command_ack_seconds = Histogram('shampoo_command_ack_seconds', "Time from interaction creation until a deferred command was acknowledged.", ('command',))
+command_missed_deadline = Counter('shampoo_command_missed_deadline_total', "Deferred commands that missed Discord's response window.", ('command',))
+store_seconds = Histogram('shampoo_store_operation_seconds', "Storage operation duration.", ('op', 'table'))
+store_bytes = Counter('shampoo_store_bytes_total', "Bytes read or written by storage operations.", ('op', 'table'))
+discord_requests = Counter('shampoo_discord_http_requests_total', "Discord HTTP API responses.", ('method', 'status'))
+discord_request_seconds = Histogram('shampoo_discord_http_request_seconds', "Discord HTTP API request duration.", ('method',))
+discord_rate_limits = Counter('shampoo_discord_rate_limits_total', "Rate limit waits: 429 responses and exhausted buckets discord.py sleeps on.", ('reason',))
+discord_rate_limit_wait = Counter('shampoo_discord_rate_limit_wait_seconds_total', "Seconds Discord asked the bot to wait.", ('reason',))
+dm_failures = Counter('shampoo_dm_failures_total', "DMs that were dead-lettered.", ('reason',))
+dm_retries = Counter('shampoo_dm_retries_total', "DM delivery attempts that were retried.")
+dm_queue_depth = Gauge('shampoo_dm_queue_depth', "DMs waiting to be delivered.")
+gateway_member_events = Counter('shampoo_gateway_member_events_total', "Member join and remove gateway events.", ('event',))
+web_request_seconds = Histogram('shampoo_web_request_seconds', "Website request duration.", ('route', 'status'))
+generated_at = Gauge('shampoo_metrics_generated_timestamp_seconds', "Unix time the bot last rendered these metrics.")
+
+
+class InstrumentedTree(app_commands.CommandTree):
+    # Stamps each interaction as the tree picks it up. The bot reports the
+    # outcome through observe_command from its completion and error handlers.
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        interaction.extras['started'] = time.perf_counter()
+        return True
+
+def observe_command(interaction: discord.Interaction, status):
+    started = interaction.extras.get('started')
+    if started is None:
+        return
+    command = interaction.command.qualified_name if interaction.command else 'unknown'
+    command_seconds.observe(time.perf_counter() - started, command=command, status=status)
+
+def _header_float(headers, name):
+    try:
+        return float(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+def http_trace():
+    # aiohttp trace hooks for discord.py's HTTP session. discord.py sleeps
+    # before the next request whenever a bucket reports no remaining calls,
+    # so those resets are counted alongside actual 429 responses.
+    trace = aiohttp.TraceConfig()
+
+    async def on_request_start(session, context, params):
+        context.started = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        response = params.response
+        discord_requests.inc(method=params.method, status=response.status)
+        discord_request_seconds.observe(time.perf_counter() - context.started, method=params.method)
+        if response.status == 429:
+            retry_after = _header_float(response.headers, 'Retry-After')
+            discord_rate_limits.inc(reason='429')
+            discord_rate_limit_wait.inc(retry_after or 0.0, reason='429')
+        elif response.headers.get('X-RateLimit-Remaining') == '0':
+            reset_after = _header_float(response.headers, 'X-RateLimit-Reset-After')
+            discord_rate_limits.inc(reason='bucket_exhausted')
+            discord_rate_limit_wait.inc(reset_after or 0.0, reason='bucket_exhausted')
+
+    async def on_request_exception(session, context, params):
+        discord_requests.inc(method=params.method, status=type(params.exception).__name__)
+
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+    trace.on_request_exception.append(on_request_exception)
+    return trace
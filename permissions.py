@@ -0,0 +1,84 @@
+import discord
+
+# Overwrite templates shared by every slot operation. They are never mutated,
+# so one instance of each is reused for every channel.
+
+SLOT_EVERYONE = discord.PermissionOverwrite(
+    read_messages=True,
+    send_messages=False,
+    send_messages_in_threads=False,
+    create_public_threads=False,
+    create_private_threads=False,
+    add_reactions=False,
+    mention_everyone=False
+)
+
+SLOT_OWNER = discord.PermissionOverwrite(
+    read_messages=True,
+    send_messages=True,
+    embed_links=True,
+    attach_files=True,
+    add_reactions=True,
+    manage_channels=True,
+    create_public_threads=False,
+    create_private_threads=False,
+    mention_everyone=False
+)
+
+SLOT_BOT = discord.PermissionOverwrite(
+    read_messages=True,
+    send_messages=True,
+    manage_channels=True,
+    manage_permissions=True
+)
+
+HIDDEN_EVERYONE = discord.PermissionOverwrite(read_messages=False)
+
+EXPIRED_OWNER = discord.PermissionOverwrite(
+    read_messages=True,
+    send_messages=False,
+    add_reactions=False,
+    manage_channels=False,
+    mention_everyone=False
+)
+
+TERMINATED_OWNER = discord.PermissionOverwrite(
+    read_messages=False,
+    send_messages=False,
+    embed_links=False,
+    attach_files=False,
+    add_reactions=False,
+    manage_channels=False,
+    manage_permissions=False,
+    manage_webhooks=False,
+    create_public_threads=False,
+    create_private_threads=False,
+    send_messages_in_threads=False,
+    mention_everyone=False,
+    view_channel=False
+)
+
+def member_target(guild: discord.Guild, user_id: int):
+    # Overwrites can target an uncached member through a typed Object.
+    return guild.get_member(user_id) or discord.Object(id=user_id, type=discord.Member)
+
+def slot_overwrites(owner, guild: discord.Guild):
+    return {
+        guild.default_role: SLOT_EVERYONE,
+        owner: SLOT_OWNER,
+        guild.me: SLOT_BOT
+    }
+
+def pool_overwrites(guild: discord.Guild):
+    return {
+        guild.default_role: HIDDEN_EVERYONE,
+        guild.me: SLOT_BOT
+    }
+
+def merged_overwrites(channel: discord.abc.GuildChannel, updates):
+    # channel.edit(overwrites=...) replaces the whole map, so carry over every
+    # existing overwrite that the update does not touch.
+    replaced = {target.id for target in updates}
+    merged = {target: overwrite for target, overwrite in channel.overwrites.items() if target.id not in replaced}
+    merged.update(updates)
+    return merged
@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+
+class TokenBucketLimiter:
+    # One token bucket per key (user or guild ID), refilled continuously at
+    # `rate` tokens per second up to `capacity`. Buckets live in an LRU map
+    # capped at max_entries; an evicted bucket simply starts full again.
+
+    def __init__(self, rate, capacity, max_entries=10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+
+    def acquire(self, key):
+        # Returns 0 if a token was taken, otherwise seconds until one is available.
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - last) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_entries:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class KeyFilter:
+    # Bloom filter over unredeemed keys. A miss means the key certainly does not
+    # exist (or was already redeemed at build time) and the store is never
+    # consulted. Redeemed keys are not removed, so the filter is rebuilt from
+    # the store once more keys were added than it was sized for.
+
+    def __init__(self, error_rate=0.001, min_capacity=10000):
+        self.error_rate = error_rate
+        self.min_capacity = min_capacity
+        self._filter = None
+        self._pending = None
+        self._in_flight = {}
+        self._rebuild_task = None
+
+    def might_contain(self, key):
+        return self._filter is None or key in self._filter
+
+    def _build(self, keys):
+        bloom = BloomFilter(max(self.min_capacity, 2 * len(keys)), self.error_rate)
+        for key in keys:
+            bloom.add(key)
+        return bloom
+
+    async def rebuild(self, store):
+        # Keys the store snapshot may not include, because their insert is
+        # still in flight or they were added while building, are replayed
+        # into the new filter before it is swapped in.
+        self._pending = list(self._in_flight.values())
+        try:
+            keys = await store.unredeemed_keys()
+            bloom = await asyncio.to_thread(self._build, keys)
+            while self._pending:
+                await asyncio.to_thread(self._add, bloom, self._pending.pop())
+            self._filter = bloom
+        finally:
+            self._pending = None
+
+    def _add(self, bloom, keys):
+        for key in keys:
+            bloom.add(key)
+
+    @asynccontextmanager
+    async def adding(self, keys, store):
+        # Wrap the store insert. The keys reach the filter first (a key the
+        # filter knows but the store doesn't yet is only a false positive) and
+        # count as in flight until the insert returns.
+        token = object()
+        self._in_flight[token] = keys
+        try:
+            if self._pending is not None:
+                self._pending.append(keys)
+            if self._filter is not None:
+                await asyncio.to_thread(self._add, self._filter, keys)
+            yield
+        finally:
+            del self._in_flight[token]
+        if self._filter is not None and self._filter.count > self._filter.capacity and self._rebuild_task is None:
+            self._rebuild_task = asyncio.create_task(self._rebuild_later(store))
+
+    async def _rebuild_later(self, store):
+        try:
+            await self.rebuild(store)
+        finally:
+            self._rebuild_task = None
@@ -0,0 +1,25 @@
+import discord
+
+
+async def find_drift(store, guild: discord.Guild, category_id, ignore):
+    # One fetch of the guild's channels, diffed as sets against the store.
+    # Slots made with /make-slot may live outside the slot category, so
+    # orphans are checked against every channel in the guild. Returns
+    # ({channel_id: owner_id} for active slots whose channel is gone,
+    #  [channels in the slot category no user record points at]).
+    # The index is read before the fetch so a slot created meanwhile is never
+    # mistaken for an orphan.
+    slots = store.slot_channels()
+    channels = await guild.fetch_channels()
+    live = {str(channel.id) for channel in channels}
+    known = await store.known_channels()
+
+    orphans = {channel_id: user_id for channel_id, user_id in slots.items() if channel_id not in live}
+    unowned = [
+        channel for channel in channels
+        if channel.category_id == category_id
+        and isinstance(channel, discord.TextChannel)
+        and str(channel.id) not in known
+        and not ignore(channel)
+    ]
+    return orphans, unowned
@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import signal
+
+import discord
+from aiohttp import web
+
+import bot as shampoo
+import server
+
+
+async def serve(port, quiet):
+    # The website shares the bot's event loop and reads stats and metrics
+    # straight from this process instead of the files the bot writes.
+    app = server.create_app(quiet, stats_source=shampoo.build_stats_snapshot, metrics_file=None)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, port=port).start()
+    print(f"Shampoo MP website running at http://localhost:{port}")
+    return runner
+
+async def main(port, quiet):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    runner = await serve(port, quiet)
+    bot_task = asyncio.create_task(shampoo.bot.start(shampoo.TOKEN))
+    stop_task = asyncio.create_task(stop.wait())
+    try:
+        await asyncio.wait({bot_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # Stop taking web requests first, then close the bot, which flushes
+        # the stores and queues.
+        print("Shutting down")
+        await runner.cleanup()
+        await shampoo.bot.close()
+        stop_task.cancel()
+        if not bot_task.done():
+            await asyncio.wait({bot_task}, timeout=10)
+    if bot_task.done() and not bot_task.cancelled():
+        bot_task.result()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the Shampoo MP bot and website in one process")
+    parser.add_argument('--port', type=int, default=server.PORT)
+    parser.add_argument('--quiet', action='store_true', help="Don't log each web request")
+    args = parser.parse_args()
+    discord.utils.setup_logging()
+    try:
+        asyncio.run(main(args.port, args.quiet))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,167 @@
+import asyncio
+import heapq
+import time
+from datetime import datetime, timedelta, timezone
+
+from store import read_json, write_json_atomic
+
+
+def iso_to_epoch(iso):
+    # Timestamps in the databases are naive UTC from datetime.utcnow().
+    dt = datetime.fromisoformat(iso)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class Scheduler:
+    # Min-heap of (due, item) driven by a single task that sleeps until the
+    # earliest entry is due. Rescheduling or cancelling leaves the old heap entry
+    # behind; it is skipped when popped because it no longer matches _due.
+    # Overdue entries are handed to the callback in concurrent batches of
+    # batch_size, yielding to the event loop between batches.
+
+    def __init__(self, callback, batch_size=25):
+        self.callback = callback
+        self.batch_size = batch_size
+        self._heap = []
+        self._due = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._due)
+
+    def pending(self):
+        return sorted((due, item) for item, due in self._due.items())
+
+    def schedule(self, item, due):
+        self._due[item] = due
+        heapq.heappush(self._heap, (due, item))
+        if self._heap[0] == (due, item):
+            self._wakeup.set()
+
+    def cancel(self, item):
+        return self._due.pop(item, None) is not None
+
+    def load(self, entries):
+        for item, due in entries:
+            self._due[item] = due
+        self._heap = [(due, item) for item, due in self._due.items()]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _discard_stale(self):
+        while self._heap:
+            due, item = self._heap[0]
+            if self._due.get(item) == due:
+                return
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now):
+        batch = []
+        while len(batch) < self.batch_size:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            due, item = heapq.heappop(self._heap)
+            del self._due[item]
+            batch.append(item)
+        return batch
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            self._discard_stale()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await asyncio.gather(*(self._fire(item) for item in self._pop_due(time.time())))
+            await asyncio.sleep(0)
+
+    async def _fire(self, item):
+        try:
+            await self.callback(item)
+        except Exception as e:
+            print(f"Scheduled task for {item} failed: {e}")
+
+
+class DeletionQueue:
+    # Pending channel deletions persisted to a JSON file as
+    # {channel_id: {"due": iso, "reason": str, ...}} and run by one Scheduler,
+    # so they survive restarts and overdue jobs run as soon as it starts.
+
+    RETRY_DELAY = timedelta(minutes=5)
+
+    def __init__(self, path, delete_channel):
+        self.path = path
+        self.jobs = {}
+        self.delete_channel = delete_channel
+        self._scheduler = Scheduler(self._run_job)
+        self._save_lock = asyncio.Lock()
+
+    async def load(self):
+        self.jobs = await asyncio.to_thread(read_json, self.path)
+        self._scheduler.load((channel_id, iso_to_epoch(job["due"])) for channel_id, job in self.jobs.items())
+
+    def start(self):
+        self._scheduler.start()
+
+    async def close(self):
+        await self._scheduler.close()
+
+    async def _save(self):
+        async with self._save_lock:
+            await asyncio.to_thread(write_json_atomic, self.path, dict(self.jobs))
+
+    def pending(self):
+        return sorted(self.jobs.items(), key=lambda item: item[1]["due"])
+
+    async def add(self, channel_id, due_iso, reason, **extra):
+        self.jobs[channel_id] = {"due": due_iso, "reason": reason, **extra}
+        self._scheduler.schedule(channel_id, iso_to_epoch(due_iso))
+        await self._save()
+
+    async def cancel(self, channel_id):
+        job = self.jobs.pop(channel_id, None)
+        if job is None:
+            return None
+        self._scheduler.cancel(channel_id)
+        await self._save()
+        return job
+
+    async def _run_job(self, channel_id):
+        job = self.jobs.get(channel_id)
+        if job is None:
+            return
+        try:
+            await self.delete_channel(channel_id, job)
+        except Exception as e:
+            retry_at = datetime.utcnow() + self.RETRY_DELAY
+            print(f"Deleting channel {channel_id} failed, retrying at {retry_at.isoformat()}: {e}")
+            self._scheduler.schedule(channel_id, iso_to_epoch(retry_at.isoformat()))
+            return
+        self.jobs.pop(channel_id, None)
+        await self._save()
@@ -1,21 +1,207 @@
-import http.server
-import socketserver
+import argparse
+import asyncio
+import gzip
+import hashlib
 import os
+import time
+
+from aiohttp import web
+
+import metrics
+from build_assets import DIST_DIR, MANIFEST_FILE, read_manifest, source_hash
+from stats import TTLCache, encode_snapshot, read_snapshot
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 PORT = 3000
 WEBSITE_FILE = os.path.join(os.path.dirname(__file__), 'website.html')
+MTIME_CHECK_INTERVAL = 1.0
+STATS_TTL = 5.0
+
+
+def accepted_encodings(header):
+    # Accept-Encoding tokens the client allows, ignoring any with q=0.
+    accepted = set()
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if token:
+            accepted.add(token.strip().lower())
+    return accepted
+
+
+class CachedPage:
+    # A file held in memory together with its gzip and (if the brotli module is
+    # installed) brotli encodings, each with its own strong ETag. The file's
+    # mtime is checked at most once per MTIME_CHECK_INTERVAL and everything is
+    # rebuilt when it changes.
+
+    def __init__(self, path, content_type):
+        self.path = path
+        self.content_type = content_type
+        self.variants = {}
+        self._mtime = None
+        self._checked_at = 0.0
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < MTIME_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        mtime = self.stamp()
+        if mtime == self._mtime:
+            return
+        self.variants = self.read_variants()
+        self._mtime = mtime
+
+    def stamp(self):
+        return os.stat(self.path).st_mtime_ns
+
+    def read_variants(self):
+        with open(self.path, 'rb') as f:
+            return self.compress(f.read())
+
+    @staticmethod
+    def compress(body):
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        variants = {'identity': (body, f'"{digest}"')}
+        variants['gzip'] = (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gz"')
+        if brotli is not None:
+            variants['br'] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+        return variants
+
+    def select(self, accept_encoding):
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and (encoding in accepted or '*' in accepted):
+                return encoding
+        return 'identity'
+
+    def response(self, request):
+        self.refresh()
+        encoding = self.select(request.headers.get('Accept-Encoding', ''))
+        body, etag = self.variants[encoding]
+        headers = {
+            'ETag': etag,
+            'Vary': 'Accept-Encoding',
+            'Cache-Control': 'no-cache'
+        }
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in (tag.strip() for tag in if_none_match.split(','))):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, headers=headers, content_type=self.content_type, charset='utf-8')
+
+
+class BuiltPage(CachedPage):
+    # Serves the minified, precompressed artifacts written by build_assets.py.
+    # Watches both the source and the manifest: while the source doesn't match
+    # the build it is served itself, compressed in memory, and re-running the
+    # build swaps the minified page back in.
+
+    def __init__(self, path, dist_dir, content_type):
+        super().__init__(path, content_type)
+        self.dist_dir = dist_dir
+
+    def stamp(self):
+        try:
+            manifest_mtime = os.stat(os.path.join(self.dist_dir, MANIFEST_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            manifest_mtime = None
+        return super().stamp(), manifest_mtime
+
+    def read_variants(self):
+        with open(self.path, 'rb') as f:
+            source = f.read()
+        manifest = read_manifest(self.dist_dir)
+        if manifest is None or manifest["source_hash"] != source_hash(source):
+            if manifest is not None:
+                print(f"{self.dist_dir} is out of date with {os.path.basename(self.path)}; serving the unminified page (run build_assets.py)")
+            return self.compress(source)
+        variants = {}
+        for encoding, entry in manifest["variants"].items():
+            with open(os.path.join(self.dist_dir, entry["file"]), 'rb') as f:
+                variants[encoding] = (f.read(), entry["etag"])
+        return variants
+
+
+@web.middleware
+async def access_log(request, handler):
+    response = await handler(request)
+    print(f"[Web] {request.remote} - \"{request.method} {request.path_qs} HTTP/{request.version.major}.{request.version.minor}\" {response.status}")
+    return response
+
+@web.middleware
+async def track_requests(request, handler):
+    # Labelled by route pattern so page URLs can't grow the label set.
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else "unmatched"
+        metrics.web_request_seconds.observe(time.perf_counter() - started, route=route, status=status)
+
+def create_app(quiet=False, stats_source=read_snapshot, stats_ttl=STATS_TTL, metrics_file=metrics.METRICS_FILE):
+    # stats_source is an async callable returning the stats dict (or None);
+    # by default the snapshot file the bot writes. metrics_file is the bot's
+    # exposition file, appended to this process's own metrics; pass None when
+    # the bot runs in this process.
+    page = BuiltPage(WEBSITE_FILE, DIST_DIR, 'text/html')
+    page.refresh()
+
+    async def load_stats():
+        snapshot = await stats_source()
+        return encode_snapshot(snapshot) if snapshot else None
+
+    stats_cache = TTLCache(load_stats, stats_ttl)
+
+    async def handle_page(request):
+        return page.response(request)
+
+    async def handle_stats(request):
+        body = await stats_cache.get()
+        if body is None:
+            return web.json_response({"error": "Stats are not available yet"}, status=503)
+        return web.Response(body=body, content_type='application/json', headers={'Cache-Control': f'public, max-age={int(stats_ttl)}'})
+
+    async def handle_metrics(request):
+        body = metrics.render()
+        if metrics_file is not None:
+            body += await asyncio.to_thread(metrics.read_exposition, metrics_file)
+        return web.Response(body=body.encode(), headers={'Content-Type': metrics.CONTENT_TYPE, 'Cache-Control': 'no-store'})
 
-class Handler(http.server.BaseHTTPRequestHandler):
-    def do_GET(self):
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html; charset=utf-8')
-        self.end_headers()
-        with open(WEBSITE_FILE, 'rb') as f:
-            self.wfile.write(f.read())
+    app = web.Application(middlewares=[track_requests] if quiet else [track_requests, access_log])
+    app.router.add_get('/api/stats', handle_stats)
+    app.router.add_get('/metrics', handle_metrics)
+    app.router.add_get('/{tail:.*}', handle_page)
+    return app
 
-    def log_message(self, format, *args):
-        print(f"[Web] {self.address_string()} - {format % args}")
+def main():
+    parser = argparse.ArgumentParser(description="Shampoo MP website")
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--quiet', action='store_true', help="Don't log each request")
+    parser.add_argument('--stats-ttl', type=float, default=STATS_TTL, help="Seconds to cache /api/stats")
+    args = parser.parse_args()
+    print(f"Shampoo MP website running at http://localhost:{args.port}")
+    web.run_app(create_app(args.quiet, stats_ttl=args.stats_ttl), port=args.port, access_log=None, print=None)
 
-with socketserver.TCPServer(("", PORT), Handler) as httpd:
-    print(f"Shampoo MP website running at http://localhost:{PORT}")
-    httpd.serve_forever()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import asyncio
+from collections import deque
+
+import aiohttp
+import discord
+
+from permissions import pool_overwrites
+
+POOL_CHANNEL_NAME = 'unclaimed-slot'
+REFILL_RETRY_SECONDS = 30
+
+
+class SlotPool:
+    # Hidden, pre-created channels in the slot category waiting to be claimed by
+    # /redeem. Unclaimed channels are recognised by name when the pool starts, so
+    # it keeps no state of its own across restarts.
+
+    def __init__(self, size, is_claimed):
+        self.size = size
+        self.is_claimed = is_claimed
+        self._channel_ids = deque()
+        self._category = None
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._channel_ids)
+
+    def is_pool_channel(self, channel):
+        return channel.name == POOL_CHANNEL_NAME and not self.is_claimed(str(channel.id))
+
+    def start(self, category: discord.CategoryChannel):
+        if self._task is not None or self.size <= 0:
+            return
+        self._category = category
+        for channel in category.text_channels:
+            if self.is_pool_channel(channel):
+                self._channel_ids.append(channel.id)
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def take(self):
+        if self._category is None:
+            return None
+        channel = None
+        while self._channel_ids and channel is None:
+            candidate = self._category.guild.get_channel(self._channel_ids.popleft())
+            if candidate is not None and not self.is_claimed(str(candidate.id)):
+                channel = candidate
+        self._wakeup.set()
+        return channel
+
+    async def _create(self):
+        guild = self._category.guild
+        return await guild.create_text_channel(POOL_CHANNEL_NAME, category=self._category, overwrites=pool_overwrites(guild))
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            while len(self._channel_ids) < self.size:
+                try:
+                    channel = await self._create()
+                except (discord.HTTPException, aiohttp.ClientError, OSError) as e:
+                    # Connection errors and timeouts are retried like API errors.
+                    print(f"Slot pool refill failed: {e!r}")
+                    await asyncio.sleep(REFILL_RETRY_SECONDS)
+                    continue
+                self._channel_ids.append(channel.id)
+            await self._wakeup.wait()
@@ -0,0 +1,387 @@
+import argparse
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from journal import Journal
+from keygen import build_key_records
+from keytable import RetiredKeys, unpack_key
+from store import ChannelIndex, file_size, read_json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS keys (
+    key TEXT PRIMARY KEY,
+    type TEXT,
+    redeemed INTEGER NOT NULL DEFAULT 0,
+    expiry TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_keys_redeemed ON keys(redeemed);
+CREATE INDEX IF NOT EXISTS idx_keys_expiry ON keys(expiry);
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    active INTEGER NOT NULL DEFAULT 0,
+    slot_channel_id TEXT,
+    guild_id TEXT,
+    expiry TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_slot_channel ON users(slot_channel_id);
+CREATE INDEX IF NOT EXISTS idx_users_guild ON users(guild_id);
+CREATE INDEX IF NOT EXISTS idx_users_expiry ON users(expiry);
+
+CREATE TABLE IF NOT EXISTS admins (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS retired_keys (
+    key TEXT PRIMARY KEY
+) WITHOUT ROWID;
+"""
+
+def _key_row(key, record):
+    return (key, record.get("type"), 1 if record.get("redeemed") else 0, record.get("expiry"), json.dumps(record))
+
+def _user_row(user_id, record):
+    return (
+        user_id,
+        1 if record.get("active") else 0,
+        record.get("slot_channel_id"),
+        record.get("guild_id"),
+        record.get("expiry"),
+        json.dumps(record)
+    )
+
+
+class SqliteStore:
+    # Same operations as JsonStore, backed by an indexed SQLite database in WAL
+    # mode. Every query runs on one dedicated worker thread, which both keeps the
+    # event loop free and serialises read-modify-write sequences.
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-store')
+        self.admin_ids = frozenset()
+        self.channel_index = ChannelIndex()
+
+    async def _run(self, fn, *args):
+        # Timed per method, including the wait for the worker thread; inline
+        # lambdas are the read queries.
+        op = 'query' if fn.__name__ == '<lambda>' else fn.__name__.lstrip('_')
+        loop = asyncio.get_running_loop()
+        with metrics.timed(metrics.store_seconds, op=op, table='sqlite'):
+            return await loop.run_in_executor(self._executor, fn, *args)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+        return conn
+
+    async def load(self):
+        self.conn = await self._run(self._open)
+        metrics.store_bytes.inc(await asyncio.to_thread(file_size, self.path), op='load', table='sqlite')
+        rows = await self._run(lambda: self.conn.execute("SELECT user_id FROM admins").fetchall())
+        self.admin_ids = frozenset(row[0] for row in rows)
+        rows = await self._run(lambda: self.conn.execute(
+            "SELECT user_id, slot_channel_id FROM users WHERE active = 1 AND slot_channel_id IS NOT NULL"
+        ).fetchall())
+        self.channel_index.rebuild((uid, {"active": True, "slot_channel_id": channel_id}) for uid, channel_id in rows)
+
+    def start(self):
+        pass
+
+    async def flush(self):
+        pass
+
+    async def close(self):
+        if self.conn is not None:
+            await self._run(self.conn.close)
+            self.conn = None
+        self._executor.shutdown(wait=True)
+
+    def _fetch_data(self, query, params):
+        row = self.conn.execute(query, params).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Keys
+
+    async def get_key(self, key):
+        return await self._run(self._fetch_data, "SELECT data FROM keys WHERE key = ?", (key,))
+
+    def _existing_keys(self, keys):
+        found = set()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT key FROM keys WHERE key IN ({placeholders}) UNION SELECT key FROM retired_keys WHERE key IN ({placeholders})",
+                chunk + chunk
+            ).fetchall()
+            found.update(row[0] for row in rows)
+        return found
+
+    async def existing_keys(self, keys):
+        return await self._run(self._existing_keys, list(keys))
+
+    async def unredeemed_keys(self):
+        rows = await self._run(lambda: self.conn.execute("SELECT key FROM keys WHERE redeemed = 0").fetchall())
+        return [row[0] for row in rows]
+
+    def _add_keys(self, records):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO keys (key, type, redeemed, expiry, data) VALUES (?, ?, ?, ?, ?)",
+                [_key_row(k, v) for k, v in records.items()]
+            )
+
+    async def add_keys(self, records):
+        await self._run(self._add_keys, records)
+
+    async def add_key_batch(self, keys, template):
+        await self._run(lambda: self._add_keys(build_key_records(keys, template)))
+
+    def _redeem_key(self, key, user_id, redeemed_at):
+        with self.conn:
+            record = self._fetch_data("SELECT data FROM keys WHERE key = ? AND redeemed = 0", (key,))
+            if record is None:
+                return False
+            record.update(redeemed=True, redeemed_by=user_id, redeemed_at=redeemed_at)
+            self.conn.execute(
+                "UPDATE keys SET redeemed = 1, data = ? WHERE key = ? AND redeemed = 0",
+                (json.dumps(record), key)
+            )
+            return True
+
+    async def redeem_key(self, key, user_id, redeemed_at):
+        return await self._run(self._redeem_key, key, user_id, redeemed_at)
+
+    def _release_key(self, key, user_id):
+        with self.conn:
+            record = self._fetch_data("SELECT data FROM keys WHERE key = ? AND redeemed = 1", (key,))
+            if record is None or record.get("redeemed_by") != user_id:
+                return False
+            record.update(redeemed=False, redeemed_by=None, redeemed_at=None)
+            self.conn.execute(
+                "UPDATE keys SET redeemed = 0, data = ? WHERE key = ? AND redeemed = 1",
+                (json.dumps(record), key)
+            )
+            return True
+
+    async def release_key(self, key, user_id):
+        return await self._run(self._release_key, key, user_id)
+
+    # Users
+
+    async def get_user(self, user_id):
+        return await self._run(self._fetch_data, "SELECT data FROM users WHERE user_id = ?", (user_id,))
+
+    def _put_user(self, user_id, record):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO users (user_id, active, slot_channel_id, guild_id, expiry, data) VALUES (?, ?, ?, ?, ?, ?)",
+            _user_row(user_id, record)
+        )
+
+    def _update_user(self, user_id, expected, fields):
+        with self.conn:
+            record = self._fetch_data("SELECT data FROM users WHERE user_id = ?", (user_id,))
+            if record is None or any(record.get(k) != v for k, v in expected.items()):
+                return None
+            old = dict(record)
+            record.update(fields)
+            self._put_user(user_id, record)
+            return old, record
+
+    async def update_user_if(self, user_id, expected, **fields):
+        result = await self._run(self._update_user, user_id, expected, fields)
+        if result is None:
+            return None
+        old, record = result
+        self.channel_index.update(user_id, old, record)
+        return record
+
+    def _claim_slot(self, user_id, record):
+        with self.conn:
+            old = self._fetch_data("SELECT data FROM users WHERE user_id = ?", (user_id,))
+            if old is not None and old.get("active"):
+                return False, None
+            self._put_user(user_id, record)
+            return True, old
+
+    async def claim_slot(self, user_id, record):
+        record = dict(record)
+        claimed, old = await self._run(self._claim_slot, user_id, record)
+        if claimed:
+            self.channel_index.update(user_id, old, record)
+        return claimed
+
+    def _add_pings(self, user_id, field, delta):
+        with self.conn:
+            record = self._fetch_data("SELECT data FROM users WHERE user_id = ?", (user_id,))
+            if record is None:
+                return None
+            count = record.get(field, 0) + delta
+            if count < 0:
+                return None
+            record[field] = count
+            self._put_user(user_id, record)
+            return count
+
+    async def add_pings(self, user_id, field, delta):
+        return await self._run(self._add_pings, user_id, field, delta)
+
+    async def expiring_slots(self):
+        return await self._run(lambda: self.conn.execute(
+            "SELECT user_id, expiry FROM users WHERE active = 1 AND expiry IS NOT NULL"
+        ).fetchall())
+
+    def channel_owner(self, channel_id):
+        return self.channel_index.owner(channel_id)
+
+    def slot_channels(self):
+        return self.channel_index.snapshot()
+
+    async def slot_counts(self):
+        active, lifetime = await self._run(lambda: self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(json_extract(data, '$.duration_days') = 'Lifetime'), 0) FROM users WHERE active = 1"
+        ).fetchone())
+        return {"active": active, "lifetime": lifetime, "timed": active - lifetime}
+
+    async def known_channels(self):
+        rows = await self._run(lambda: self.conn.execute(
+            "SELECT slot_channel_id FROM users WHERE slot_channel_id IS NOT NULL"
+        ).fetchall())
+        return {channel_id for channel_id, in rows}
+
+    async def find_user_by_channel(self, channel_id):
+        user_id = self.channel_index.owner(channel_id)
+        if user_id is None:
+            return None, None
+        return user_id, await self.get_user(user_id)
+
+    # Archival
+
+    def _cold_records(self, cutoff):
+        keys = {
+            key: json.loads(data) for key, data in self.conn.execute(
+                "SELECT key, data FROM keys WHERE redeemed = 1 AND json_extract(data, '$.redeemed_at') < ?", (cutoff,)
+            )
+        }
+        users = {
+            user_id: json.loads(data) for user_id, data in self.conn.execute(
+                "SELECT user_id, data FROM users WHERE active = 0 AND json_extract(data, '$.terminated') = 1"
+                " AND json_extract(data, '$.terminated_at') < ?", (cutoff,)
+            )
+        }
+        return keys, users
+
+    async def cold_records(self, cutoff):
+        return await self._run(self._cold_records, cutoff)
+
+    def _remove(self, table, column, records):
+        removed = []
+        with self.conn:
+            for ident, record in records.items():
+                if self._fetch_data(f"SELECT data FROM {table} WHERE {column} = ?", (ident,)) == record:
+                    self.conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (ident,))
+                    removed.append(ident)
+            if table == 'keys':
+                # Archived keys stay in retired_keys so they are never issued twice.
+                self.conn.executemany("INSERT OR IGNORE INTO retired_keys (key) VALUES (?)", [(key,) for key in removed])
+        return removed
+
+    async def remove_keys(self, records):
+        return await self._run(self._remove, 'keys', 'key', records)
+
+    async def remove_users(self, records):
+        removed = await self._run(self._remove, 'users', 'user_id', records)
+        for user_id in removed:
+            self.channel_index.update(user_id, records[user_id], None)
+        return removed
+
+    # Admins
+
+    def is_admin(self, user_id):
+        return user_id in self.admin_ids
+
+    def _add_admin(self, user_id, record):
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT OR IGNORE INTO admins (user_id, data) VALUES (?, ?)",
+                (user_id, json.dumps(record))
+            )
+            return cur.rowcount == 1
+
+    async def add_admin(self, user_id, record):
+        added = await self._run(self._add_admin, user_id, record)
+        if added:
+            self.admin_ids = self.admin_ids | {user_id}
+        return added
+
+    def _remove_admin(self, user_id):
+        with self.conn:
+            return self.conn.execute("DELETE FROM admins WHERE user_id = ?", (user_id,)).rowcount == 1
+
+    async def remove_admin(self, user_id):
+        removed = await self._run(self._remove_admin, user_id)
+        if removed:
+            self.admin_ids = self.admin_ids - {user_id}
+        return removed
+
+
+def migrate(db_path, keys_path, users_path, admins_path, retired_path=None):
+    keys = read_json(keys_path)
+    users = read_json(users_path)
+    admins = read_json(admins_path)
+    retired = RetiredKeys.from_record(read_json(retired_path)) if retired_path else RetiredKeys()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO keys (key, type, redeemed, expiry, data) VALUES (?, ?, ?, ?, ?)",
+            [_key_row(k, v) for k, v in keys.items()]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO users (user_id, active, slot_channel_id, guild_id, expiry, data) VALUES (?, ?, ?, ?, ?, ?)",
+            [_user_row(uid, data) for uid, data in users.items()]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO admins (user_id, data) VALUES (?, ?)",
+            [(uid, json.dumps(data)) for uid, data in admins.items()]
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO retired_keys (key) VALUES (?)",
+            [(unpack_key(packed),) for packed in retired.ids] + [(key,) for key in retired.other]
+        )
+    conn.close()
+    return len(keys), len(users), len(admins)
+
+def main():
+    parser = argparse.ArgumentParser(description="Shampoo MP SQLite storage tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    mig = sub.add_parser('migrate', help="Import the JSON databases into SQLite")
+    mig.add_argument('--db', default='database/shampoo.db')
+    mig.add_argument('--keys', default='database/valid_keys.json')
+    mig.add_argument('--users', default='database/user_database.json')
+    mig.add_argument('--admins', default='database/admins.json')
+    mig.add_argument('--retired', default='database/retired_keys.json')
+    mig.add_argument('--journal', default='database/journal')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        if Journal(args.journal).segments():
+            parser.error(f"{args.journal} holds changes not yet in the JSON files; stop the bot cleanly before migrating")
+        keys, users, admins = migrate(args.db, args.keys, args.users, args.admins, args.retired)
+        print(f"Imported {keys} keys, {users} users and {admins} admins into {args.db}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import os
+import time
+
+from store import read_json, write_json_atomic
+
+STATS_SNAPSHOT_FILE = 'database/stats_snapshot.json'
+
+
+class TTLCache:
+    # Holds the result of an async loader for ttl seconds. Concurrent callers
+    # after expiry share one reload instead of each running the loader.
+
+    def __init__(self, loader, ttl):
+        self.loader = loader
+        self.ttl = ttl
+        self._value = None
+        self._expires = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self):
+        if time.monotonic() < self._expires:
+            return self._value
+        async with self._lock:
+            if time.monotonic() >= self._expires:
+                self._value = await self.loader()
+                self._expires = time.monotonic() + self.ttl
+        return self._value
+
+
+class SnapshotWriter:
+    # Periodically writes the value returned by build() (a dict, as JSON, unless
+    # another write function is given) to a file that the standalone web server
+    # reads, so web traffic never reaches the bot's stores or the Discord API.
+
+    def __init__(self, path, build, interval, write=write_json_atomic):
+        self.path = path
+        self.build = build
+        self.interval = interval
+        self.write = write
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                snapshot = await self.build()
+                await asyncio.to_thread(self._write, snapshot)
+            except Exception as e:
+                # Logged and retried next interval so the file never goes stale for good.
+                print(f"Writing {os.path.basename(self.path)} failed: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    def _write(self, snapshot):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.write(self.path, snapshot)
+
+
+async def read_snapshot(path=STATS_SNAPSHOT_FILE):
+    return await asyncio.to_thread(read_json, path) or None
+
+def encode_snapshot(snapshot):
+    return json.dumps(snapshot, separators=(",", ":")).encode()
@@ -0,0 +1,457 @@
+import asyncio
+import json
+import os
+import tempfile
+
+import metrics
+from journal import Journal
+from keytable import KeyTable, RetiredKeys
+
+INLINE_KEY_CHECK = 1000
+BATCH_SWAP_ATTEMPTS = 3
+
+
+def read_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def _dump_items(items, f):
+    # Same layout as json.dump(indent=4) on a dict, but streamed one entry at a
+    # time so tables that build their records lazily are never fully materialised.
+    f.write("{")
+    separator = "\n"
+    for key, value in items:
+        f.write(separator + "    " + json.dumps(key) + ": " + json.dumps(value, indent=4).replace("\n", "\n    "))
+        separator = ",\n"
+    f.write("}" if separator == "\n" else "\n}")
+
+def write_json_atomic(path, data):
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            _dump_items(data.items(), f)
+            f.flush()
+            os.fsync(f.fileno())
+            size = os.fstat(f.fileno()).st_size
+        os.replace(tmp_path, path)
+        return size
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def file_size(path):
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return 0
+
+def file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class ChannelIndex:
+    # Reverse index of active slot channels to their owner's user ID.
+
+    def __init__(self):
+        self._owners = {}
+
+    def rebuild(self, users):
+        self._owners = {}
+        for user_id, record in users:
+            self.update(user_id, None, record)
+
+    def update(self, user_id, old, new):
+        old_channel = old.get("slot_channel_id") if old else None
+        if old_channel is not None and self._owners.get(old_channel) == user_id:
+            del self._owners[old_channel]
+        if new and new.get("active") and new.get("slot_channel_id") is not None:
+            self._owners[new["slot_channel_id"]] = user_id
+
+    def owner(self, channel_id):
+        return self._owners.get(channel_id)
+
+    def snapshot(self):
+        return dict(self._owners)
+
+    def __len__(self):
+        return len(self._owners)
+
+
+class JsonStore:
+    # Keys, users and admins live in memory and are written back in coalesced,
+    # atomic flushes. Records are replaced rather than mutated in place, so a
+    # shallow copy of a table is a consistent snapshot for the writer thread.
+    # Keys are held in a compact KeyTable rather than a dict of dicts.
+    #
+    # With a journal directory every mutation is also appended to a write-ahead
+    # journal before the call returns; the JSON files become snapshots that are
+    # only rewritten (compacted) once the journal outgrows compact_bytes, and
+    # load() replays the journal over them.
+
+    def __init__(self, keys_path, users_path, admins_path, flush_interval=5.0, journal_dir=None, compact_bytes=4 * 1024 * 1024, retired_path=None):
+        self.paths = {'keys': keys_path, 'users': users_path, 'admins': admins_path}
+        if retired_path:
+            self.paths['retired'] = retired_path
+        self.flush_interval = flush_interval
+        self.journal = Journal(journal_dir) if journal_dir else None
+        self.compact_bytes = compact_bytes
+        self.keys = KeyTable()
+        self.retired = RetiredKeys()
+        self.users = {}
+        self.admins = {}
+        self.admin_ids = frozenset()
+        self.channel_index = ChannelIndex()
+        self._admins_mtime = None
+        self._dirty = set()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+        self._loaded = False
+        self._key_writes = 0
+
+    async def load(self):
+        self.keys = await self._read_table('keys', KeyTable.from_records)
+        if 'retired' in self.paths:
+            self.retired = await self._read_table('retired', RetiredKeys.from_record)
+        self.users = await self._read_table('users')
+        self.admins = await self._read_table('admins')
+        self._admins_mtime = await asyncio.to_thread(file_mtime, self.paths['admins'])
+        self._dirty.clear()
+        if self.journal is not None:
+            with metrics.timed(metrics.store_seconds, op='replay', table='journal'):
+                for entry in await asyncio.to_thread(self.journal.replay):
+                    self._apply(entry)
+        self._set_admins(self.admins)
+        self.channel_index.rebuild(self.users.items())
+        self._loaded = True
+
+    async def _read_table(self, name, parse=None):
+        path = self.paths[name]
+
+        def read():
+            data = read_json(path)
+            return parse(data) if parse else data, file_size(path)
+
+        with metrics.timed(metrics.store_seconds, op='load', table=name):
+            data, size = await asyncio.to_thread(read)
+        metrics.store_bytes.inc(size, op='load', table=name)
+        return data
+
+    def start(self):
+        if self.journal is not None:
+            self.journal.start()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        if self.journal is not None:
+            await self.journal.close()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                # Admin changes are compacted promptly so hand edits of the
+                # admins file aren't held back behind a long-lived journal.
+                if self.journal is None or self.journal.size >= self.compact_bytes or 'admins' in self._dirty:
+                    await self.flush()
+                await self.reload_admins_if_changed()
+            except OSError as e:
+                print(f"Store flush failed: {e}")
+
+    def _mark(self, name):
+        if name not in self.paths:
+            return
+        self._dirty.add(name)
+        if name == 'keys':
+            self._key_writes += 1
+
+    async def _log(self, op, **fields):
+        if self.journal is not None:
+            await self.journal.append(op, **fields)
+
+    def _apply(self, entry):
+        # Journal entries carry the resulting values, so replaying an entry a
+        # snapshot already reflects leaves the state unchanged.
+        op = entry["op"]
+        if op == "key_created":
+            self.keys.update(entry["records"])
+        elif op == "key_batch_created":
+            self.keys.add_batch(entry["keys"], entry["template"])
+        elif op == "key_redeemed":
+            self.keys.redeem(entry["key"], entry["user_id"], entry["redeemed_at"])
+        elif op == "key_released":
+            self.keys.release(entry["key"], entry["user_id"])
+        elif op in ("user_put", "slot_created"):
+            self.users[entry["user_id"]] = entry["record"]
+        elif op in ("user_updated", "ping_credited", "ping_spent"):
+            record = self.users.get(entry["user_id"])
+            if record is not None:
+                self.users[entry["user_id"]] = {**record, **entry["fields"]}
+        elif op == "key_archived":
+            for key in entry["keys"]:
+                self.keys.pop(key, None)
+            self.retired.add_many(entry["keys"])
+            self._mark('retired')
+        elif op == "user_archived":
+            for user_id in entry["user_ids"]:
+                self.users.pop(user_id, None)
+        elif op == "admin_added":
+            self.admins = {**self.admins, entry["user_id"]: entry["record"]}
+        elif op == "admin_removed":
+            self.admins = {k: v for k, v in self.admins.items() if k != entry["user_id"]}
+        elif op == "admins_reloaded":
+            self.admins = entry["admins"]
+        else:
+            print(f"Skipping unknown journal entry: {op}")
+            return
+        self._mark('keys' if op.startswith("key") else 'admins' if op.startswith("admin") else 'users')
+
+    async def flush(self):
+        # With a journal this is a compaction: the tables are snapshotted and
+        # the journal rotated at the same instant, and the sealed segments are
+        # only dropped once every snapshot is safely on disk. Before load() the
+        # tables are empty and the journal unreplayed, so there is nothing to
+        # write and compacting would discard committed segments.
+        if not self._loaded:
+            return
+        async with self._flush_lock:
+            dirty, self._dirty = self._dirty, set()
+            snapshots = {name: getattr(self, name).copy() for name in dirty}
+            boundary = self.journal.rotate() if self.journal is not None else None
+            for name, snapshot in snapshots.items():
+                try:
+                    with metrics.timed(metrics.store_seconds, op='save', table=name):
+                        size = await asyncio.to_thread(write_json_atomic, self.paths[name], snapshot)
+                except BaseException:
+                    self._dirty.update(snapshots)
+                    raise
+                metrics.store_bytes.inc(size, op='save', table=name)
+                if name == 'admins':
+                    self._admins_mtime = await asyncio.to_thread(file_mtime, self.paths['admins'])
+            if boundary is not None:
+                await self.journal.discard_before(boundary)
+
+    # Keys
+
+    async def get_key(self, key):
+        return self.keys.get(key)
+
+    async def existing_keys(self, keys):
+        # Archived keys count as taken so they are never issued twice.
+        if len(keys) <= INLINE_KEY_CHECK:
+            return {key for key in keys if key in self.keys or key in self.retired}
+        # Large batches are checked against a snapshot in a worker thread.
+        snapshot, retired = self.keys.copy(), self.retired.copy()
+        return await asyncio.to_thread(lambda: {key for key in keys if key in snapshot or key in retired})
+
+    async def unredeemed_keys(self):
+        snapshot = self.keys.copy()
+        return await asyncio.to_thread(lambda: list(snapshot.unredeemed()))
+
+    async def add_keys(self, records):
+        self.keys.update(records)
+        self._mark('keys')
+        await self._log("key_created", records=records)
+
+    async def add_key_batch(self, keys, template):
+        # The batch is added to a copy of the table in a worker thread, which is
+        # swapped in unless another key write landed meanwhile; after a few
+        # such collisions it is added in place. The journal line is serialised
+        # in the thread as well.
+        keys = list(keys)
+        line = None
+        for _ in range(BATCH_SWAP_ATTEMPTS):
+            writes = self._key_writes
+            table = self.keys.copy()
+            line = await asyncio.to_thread(self._build_batch, table, keys, template)
+            if self._key_writes == writes:
+                self.keys = table
+                break
+        else:
+            self.keys.add_batch(keys, template)
+        self._mark('keys')
+        if line is not None:
+            await self.journal.append_line(line)
+
+    def _build_batch(self, table, keys, template):
+        table.add_batch(keys, template)
+        if self.journal is not None:
+            return Journal.encode("key_batch_created", keys=keys, template=template)
+        return None
+
+    async def redeem_key(self, key, user_id, redeemed_at):
+        if not self.keys.redeem(key, user_id, redeemed_at):
+            return False
+        self._mark('keys')
+        await self._log("key_redeemed", key=key, user_id=user_id, redeemed_at=redeemed_at)
+        return True
+
+    async def release_key(self, key, user_id):
+        if not self.keys.release(key, user_id):
+            return False
+        self._mark('keys')
+        await self._log("key_released", key=key, user_id=user_id)
+        return True
+
+    # Users
+
+    async def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    def _set_user(self, user_id, record):
+        self.channel_index.update(user_id, self.users.get(user_id), record)
+        self.users[user_id] = record
+        self._mark('users')
+
+    async def update_user_if(self, user_id, expected, **fields):
+        # Compare-and-set: applied only if every expected field still matches.
+        record = self.users.get(user_id)
+        if record is None or any(record.get(k) != v for k, v in expected.items()):
+            return None
+        record = {**record, **fields}
+        self._set_user(user_id, record)
+        await self._log("user_updated", user_id=user_id, fields=fields)
+        return record
+
+    async def claim_slot(self, user_id, record):
+        # Stores the record unless the user already holds an active slot.
+        current = self.users.get(user_id)
+        if current is not None and current.get("active"):
+            return False
+        record = dict(record)
+        self._set_user(user_id, record)
+        await self._log("slot_created", user_id=user_id, record=record)
+        return True
+
+    async def add_pings(self, user_id, field, delta):
+        record = self.users.get(user_id)
+        if record is None:
+            return None
+        count = record.get(field, 0) + delta
+        if count < 0:
+            return None
+        self.users[user_id] = {**record, field: count}
+        self._mark('users')
+        await self._log("ping_credited" if delta > 0 else "ping_spent", user_id=user_id, fields={field: count})
+        return count
+
+    async def expiring_slots(self):
+        return [
+            (uid, data["expiry"]) for uid, data in self.users.items()
+            if data.get("active") and data.get("expiry")
+        ]
+
+    def channel_owner(self, channel_id):
+        return self.channel_index.owner(channel_id)
+
+    def slot_channels(self):
+        return self.channel_index.snapshot()
+
+    async def slot_counts(self):
+        active = [record for record in self.users.values() if record.get("active")]
+        lifetime = sum(1 for record in active if record.get("duration_days") == "Lifetime")
+        return {"active": len(active), "lifetime": lifetime, "timed": len(active) - lifetime}
+
+    async def known_channels(self):
+        # Every channel any user record points at, active or not.
+        return {record["slot_channel_id"] for record in self.users.values() if record.get("slot_channel_id")}
+
+    async def find_user_by_channel(self, channel_id):
+        user_id = self.channel_index.owner(channel_id)
+        if user_id is None:
+            return None, None
+        return user_id, self.users.get(user_id)
+
+    # Archival
+
+    async def cold_records(self, cutoff):
+        # Keys redeemed and slots terminated before cutoff, as {id: record}.
+        snapshot = self.keys.copy()
+        keys = await asyncio.to_thread(lambda: {key: snapshot.get(key) for key in snapshot.redeemed_before(cutoff)})
+        users = {
+            user_id: record for user_id, record in self.users.items()
+            if record.get("terminated") and not record.get("active") and (record.get("terminated_at") or cutoff) < cutoff
+        }
+        return keys, users
+
+    async def remove_keys(self, records):
+        # Only records still identical to the given ones are removed.
+        removed = [key for key, record in records.items() if self.keys.get(key) == record]
+        for key in removed:
+            self.keys.pop(key)
+        self.retired.add_many(removed)
+        if removed:
+            self._mark('keys')
+            self._mark('retired')
+            await self._log("key_archived", keys=removed)
+        return removed
+
+    async def remove_users(self, records):
+        removed = [user_id for user_id, record in records.items() if self.users.get(user_id) == record]
+        for user_id in removed:
+            self.channel_index.update(user_id, self.users.pop(user_id), None)
+        if removed:
+            self._mark('users')
+            await self._log("user_archived", user_ids=removed)
+        return removed
+
+    # Admins
+
+    # Membership checks hit a frozenset that is swapped wholesale on change, so
+    # is_admin never does I/O. Hand edits to admins.json are picked up by the
+    # flush loop when the file's mtime moves, unless local changes are pending.
+
+    def _set_admins(self, admins):
+        self.admins = admins
+        self.admin_ids = frozenset(admins)
+
+    def is_admin(self, user_id):
+        return user_id in self.admin_ids
+
+    async def reload_admins_if_changed(self):
+        if 'admins' in self._dirty:
+            return False
+        path = self.paths['admins']
+        mtime = await asyncio.to_thread(file_mtime, path)
+        if mtime == self._admins_mtime:
+            return False
+        self._set_admins(await asyncio.to_thread(read_json, path))
+        self._admins_mtime = mtime
+        await self._log("admins_reloaded", admins=self.admins)
+        return True
+
+    async def add_admin(self, user_id, record):
+        if user_id in self.admin_ids:
+            return False
+        record = dict(record)
+        self._set_admins({**self.admins, user_id: record})
+        self._mark('admins')
+        await self._log("admin_added", user_id=user_id, record=record)
+        return True
+
+    async def remove_admin(self, user_id):
+        if user_id not in self.admin_ids:
+            return False
+        admins = dict(self.admins)
+        del admins[user_id]
+        self._set_admins(admins)
+        self._mark('admins')
+        await self._log("admin_removed", user_id=user_id)
+        return True
@@ -0,0 +1,48 @@
+import asyncio
+
+from keygen import mint_keys
+from ratelimit import KeyFilter
+from store import JsonStore
+
+TEMPLATE = {
+    "type": "license",
+    "duration_days": 30,
+    "expiry": None,
+    "generated_at": "2024-01-01T00:00:00",
+    "generated_by": "1",
+    "redeemed": False,
+    "redeemed_by": None,
+    "redeemed_at": None,
+}
+
+
+async def add_batch(store, key_filter, count):
+    keys = await mint_keys(store, count)
+    async with key_filter.adding(keys, store):
+        await store.add_key_batch(keys, TEMPLATE)
+    return keys
+
+async def settle(key_filter):
+    while key_filter._rebuild_task is not None:
+        await key_filter._rebuild_task
+
+def open_store(tmp_path):
+    return JsonStore(str(tmp_path / "keys.json"), str(tmp_path / "users.json"), str(tmp_path / "admins.json"), journal_dir=str(tmp_path / "journal"))
+
+def test_rebuild_keeps_keys_whose_insert_is_in_flight(tmp_path):
+    async def run():
+        store = open_store(tmp_path)
+        await store.load()
+        store.start()
+        key_filter = KeyFilter()
+        await key_filter.rebuild(store)
+
+        first = await add_batch(store, key_filter, 20000)
+        # A second batch still inside add_key_batch while the rebuild runs.
+        second, third = await asyncio.gather(add_batch(store, key_filter, 20000), add_batch(store, key_filter, 20000))
+        await settle(key_filter)
+        await store.close()
+        return key_filter, first + second + third
+
+    key_filter, keys = asyncio.run(run())
+    assert all(key_filter.might_contain(key) for key in keys)
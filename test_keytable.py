@@ -0,0 +1,86 @@
+import random
+
+from keygen import KEY_PREFIX
+from keytable import KeyTable, RetiredKeys
+
+
+def random_key(rng, pool=None):
+    if pool and rng.random() < 0.5:
+        return rng.choice(pool)
+    if rng.random() < 0.05:
+        return f"legacy-{rng.randrange(50)}"
+    return KEY_PREFIX + "".join(rng.choice("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(8))
+
+def random_record(rng):
+    redeemed = rng.random() < 0.5
+    return {
+        "type": rng.choice(["license", "license_lifetime", "everyone_ping", "here_ping"]),
+        "duration_days": rng.choice([None, "Lifetime", 7, 30]),
+        "expiry": rng.choice([None, "2030-01-02T03:04:05"]),
+        "generated_at": "2024-05-06T07:08:09",
+        "generated_by": str(rng.randrange(1, 1 << 60)),
+        "redeemed": redeemed,
+        "redeemed_by": str(rng.randrange(1, 1 << 60)) if redeemed else None,
+        "redeemed_at": "2024-06-07T08:09:10" if redeemed else None,
+    }
+
+def check_same(table, expected):
+    assert len(table) == len(expected)
+    assert dict(table.items()) == expected
+    for key, record in expected.items():
+        assert key in table
+        assert table[key] == record
+
+def test_matches_dict_under_random_operations():
+    rng = random.Random(1234)
+    table, expected = KeyTable(), {}
+    for step in range(4000):
+        pool = list(expected)
+        op = rng.random()
+        if op < 0.45:
+            key, record = random_key(rng, pool), random_record(rng)
+            table[key] = record
+            expected[key] = record
+        elif op < 0.75:
+            key = random_key(rng, pool)
+            assert table.pop(key, None) == expected.pop(key, None)
+        elif op < 0.85:
+            key = random_key(rng, pool)
+            user_id = str(rng.randrange(1, 1000))
+            record = expected.get(key)
+            redeemed = table.redeem(key, user_id, "2025-01-01T00:00:00")
+            assert redeemed == (record is not None and not record["redeemed"])
+            if redeemed:
+                expected[key] = {**record, "redeemed": True, "redeemed_by": user_id, "redeemed_at": "2025-01-01T00:00:00"}
+        else:
+            keys = [random_key(rng, pool) for _ in range(rng.randrange(1, 40))]
+            keys += rng.sample(keys, min(len(keys), 5))
+            template = random_record(rng)
+            table.add_batch(keys, template)
+            for key in keys:
+                expected[key] = dict(template)
+        if step % 200 == 0:
+            check_same(table, expected)
+    check_same(table, expected)
+    check_same(table.copy(), expected)
+
+def test_add_batch_with_repeated_keys():
+    table = KeyTable()
+    key = KEY_PREFIX + "AAAAAAAA"
+    record = random_record(random.Random(1))
+    table.add_batch([key, KEY_PREFIX + "BBBBBBBB", key], record)
+    assert len(table) == 2
+    assert table[key] == record
+    assert len(table.ids) == len(table.redeemed_at)
+
+def test_retired_keys_match_set():
+    rng = random.Random(99)
+    retired, expected = RetiredKeys(), set()
+    for _ in range(50):
+        keys = [random_key(rng, list(expected)) for _ in range(rng.randrange(1, 30))]
+        retired.add_many(keys)
+        expected.update(keys)
+    restored = RetiredKeys.from_record(dict(retired.items()))
+    for key in list(expected) + [random_key(rng) for _ in range(200)]:
+        assert (key in retired) == (key in expected) == (key in restored)
+    assert len(retired) == len(expected)